@@ -0,0 +1,115 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# Microbenchmark of the JSON renderer and parser of the API against the REST
+# framework ones, on balances and expenses payloads like the list endpoints
+# return, reporting the payloads rendered and parsed per second:
+#
+#     python -m split_free_backend.benchmarks.rendering --rows 10 100 1000 --repeat 5
+
+import argparse
+import io
+import os
+import time
+
+DEFAULT_ROWS = (10, 100, 1000, 10000)
+
+
+def balances_payload(number_of_rows):
+    return [
+        {"id": i, "currency": "EUR", "amount": f"{(i % 200 - 100) / 4:.2f}", "owner": i, "group": 1}
+        for i in range(number_of_rows)
+    ]
+
+
+def expenses_payload(number_of_rows):
+    return [
+        {
+            "id": i,
+            "amount": f"{i / 10:.2f}",
+            "title": f"Dîner {i}",
+            "description": None if i % 2 else "Pizza & drinks",
+            "currency": "EUR",
+            "date": "2024-01-01",
+            "payer": i,
+            "group": 1,
+            "participants": [i, i + 1, i + 2],
+        }
+        for i in range(number_of_rows)
+    ]
+
+
+PAYLOADS = {
+    "balances": balances_payload,
+    "expenses": expenses_payload,
+}
+
+
+def measure(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+def run_benchmark(rows=DEFAULT_ROWS, payloads=tuple(PAYLOADS), repeat=1):
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from split_free_backend.core.parsers import FastJSONParser
+    from split_free_backend.core.renderers import FastJSONRenderer
+
+    results = []
+    for payload in payloads:
+        for number_of_rows in rows:
+            data = PAYLOADS[payload](number_of_rows)
+            result = {"payload": payload, "rows": number_of_rows}
+            for name, renderer, parser in (
+                ("stdlib", JSONRenderer(), JSONParser()),
+                ("fast", FastJSONRenderer(), FastJSONParser()),
+            ):
+                render_seconds, content = measure(lambda: renderer.render(data), repeat)
+                parse_seconds, parsed = measure(lambda: parser.parse(io.BytesIO(content)), repeat)
+                result |= {
+                    f"{name}_render_seconds": render_seconds,
+                    f"{name}_parse_seconds": parse_seconds,
+                    f"{name}_content": content,
+                    f"{name}_parsed": parsed,
+                }
+            result["bytes"] = len(result["stdlib_content"])
+            result["identical"] = (
+                result.pop("stdlib_content") == result.pop("fast_content")
+                and result.pop("stdlib_parsed") == result.pop("fast_parsed") == data
+            )
+            results.append(result)
+    return results
+
+
+def print_results(results):
+    print(f"{'payload':<10}{'rows':>7}{'KiB':>9}{'render/s':>11}{'fast':>11}{'parse/s':>11}{'fast':>11}  identical")
+    for result in results:
+        print(
+            f"{result['payload']:<10}{result['rows']:>7}{result['bytes'] / 1024:>9.1f}"
+            f"{1 / result['stdlib_render_seconds']:>11.0f}{1 / result['fast_render_seconds']:>11.0f}"
+            f"{1 / result['stdlib_parse_seconds']:>11.0f}{1 / result['fast_parse_seconds']:>11.0f}"
+            f"  {result['identical']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON renderer and parser of the API.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--payloads", nargs="+", choices=PAYLOADS, default=tuple(PAYLOADS))
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "split_free_backend.project.settings")
+    import django
+
+    django.setup()
+    print_results(run_benchmark(rows=arguments.rows, payloads=arguments.payloads, repeat=arguments.repeat))
+
+
+if __name__ == "__main__":
+    main()
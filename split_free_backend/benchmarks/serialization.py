@@ -0,0 +1,143 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# Benchmark of the serialization of the list endpoints, reporting for each
+# endpoint the rows serialized to JSON per second by the model serializers and
+# from the columns, on a test database:
+#
+#     python -m split_free_backend.benchmarks.serialization --rows 100 1000 10000 --repeat 3
+
+import argparse
+import os
+import time
+from decimal import Decimal
+
+DEFAULT_ROWS = (100, 1000, 10000)
+
+
+def create_rows(number_of_rows):
+    from split_free_backend.core.models import Balance, Debt, Expense, Group, Member
+
+    group = Group.objects.create(title="Benchmark")
+    members = Member.objects.bulk_create([Member(name=f"Member{i}", group=group) for i in range(number_of_rows)])
+    Balance.objects.bulk_create(
+        [Balance(owner=member, group=group, amount=Decimal(i % 200 - 100) / 4) for i, member in enumerate(members)]
+    )
+    Debt.objects.bulk_create(
+        [
+            Debt(group=group, borrower=members[i], lender=members[(i + 1) % number_of_rows], amount=Decimal(i) / 100)
+            for i in range(number_of_rows)
+        ]
+    )
+    expenses = Expense.objects.bulk_create(
+        [
+            Expense(title=f"Expense{i}", amount=Decimal(i) / 10, group=group, payer=members[i], date="2024-01-01")
+            for i in range(number_of_rows)
+        ]
+    )
+    Expense.participants.through.objects.bulk_create(
+        [
+            Expense.participants.through(expense=expense, member=members[(i + j) % number_of_rows])
+            for i, expense in enumerate(expenses)
+            for j in range(min(3, number_of_rows))
+        ]
+    )
+    return group
+
+
+def get_endpoints(group):
+    from django.db.models import Prefetch
+
+    from split_free_backend.core.models import Balance, Debt, Expense, Member
+    from split_free_backend.core.serializers import (
+        BalanceSerializer,
+        DebtSerializer,
+        ExpenseSerializer,
+        MemberSerializer,
+    )
+
+    return {
+        "members": (Member.objects.filter(group=group), MemberSerializer),
+        "expenses": (
+            Expense.objects.filter(group=group).prefetch_related(
+                Prefetch("participants", queryset=Member.objects.order_by("id"))
+            ),
+            ExpenseSerializer,
+        ),
+        "debts": (Debt.objects.filter(group=group), DebtSerializer),
+        "balances": (Balance.objects.filter(group=group), BalanceSerializer),
+    }
+
+
+def measure(serialize, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = serialize()
+        durations.append(time.perf_counter() - start)
+    return min(durations), content
+
+
+def run_benchmark(rows=DEFAULT_ROWS, repeat=1):
+    from rest_framework.renderers import JSONRenderer
+
+    from split_free_backend.core.fast_serializers import get_values_serializer
+
+    renderer = JSONRenderer()
+    results = []
+    for number_of_rows in rows:
+        group = create_rows(number_of_rows)
+        for endpoint, (queryset, serializer_class) in get_endpoints(group).items():
+            values_serializer = get_values_serializer(serializer_class)
+            # Fresh querysets, not to measure their result cache
+            model_seconds, model_content = measure(
+                lambda: renderer.render(serializer_class(queryset.all(), many=True).data), repeat
+            )
+            values_seconds, values_content = measure(
+                lambda: renderer.render(values_serializer.serialize(queryset.all())), repeat
+            )
+            results.append(
+                {
+                    "endpoint": endpoint,
+                    "rows": number_of_rows,
+                    "model_rows_per_second": number_of_rows / model_seconds,
+                    "values_rows_per_second": number_of_rows / values_seconds,
+                    "identical": model_content == values_content,
+                }
+            )
+        group.delete()
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<10}{'rows':>8}{'model rows/s':>15}{'values rows/s':>15}{'speedup':>9}  identical")
+    for result in results:
+        print(
+            f"{result['endpoint']:<10}{result['rows']:>8}{result['model_rows_per_second']:>15.0f}"
+            f"{result['values_rows_per_second']:>15.0f}"
+            f"{result['values_rows_per_second'] / result['model_rows_per_second']:>8.1f}x  {result['identical']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the serialization of the list endpoints.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "split_free_backend.project.settings")
+    import django
+
+    django.setup()
+    from django.db import connection
+
+    # The rows are written to a test database, dropped afterwards
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        print_results(run_benchmark(rows=arguments.rows, repeat=arguments.repeat))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# Benchmark of the settlement strategies on synthetic groups, reporting for each
+# group and strategy the wall time, the peak memory and the number of transfers:
+#
+#     python -m split_free_backend.benchmarks.settlement --sizes 3 10 25 --repeat 3
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from split_free_backend.core.settlement import STRATEGIES, settle
+
+DEFAULT_SIZES = (3, 5, 10, 15, 20, 25, 50, 100, 200)
+
+
+def with_last_balance_settling(amounts):
+    # Balances of a group always sum up to 0
+    amounts.append(-sum(amounts))
+    return list(enumerate(amounts))
+
+
+def random_group(size, random_generator):
+    return with_last_balance_settling([random_generator.randint(-10000, 10000) for _ in range(size - 1)])
+
+
+def one_payer_group(size, random_generator):
+    # One member paid for everyone, nobody else can settle among themselves
+    share = random_generator.randint(100, 10000)
+    return with_last_balance_settling([share] * (size - 1))
+
+
+def pairs_group(size, random_generator):
+    amounts = []
+    for _ in range(size // 2):
+        amount = random_generator.randint(1, 10000)
+        amounts.extend([amount, -amount])
+    return with_last_balance_settling(amounts[: size - 1])
+
+
+def no_subgroup_group(size, random_generator):
+    # Adversarial: distinct amounts of many digits, so that the only zero-sum
+    # selection is the whole group and the exact search cannot stop early
+    return with_last_balance_settling(
+        [random_generator.randint(10**6, 10**8) * random_generator.choice([-1, 1]) for _ in range(size - 1)]
+    )
+
+
+def small_amounts_group(size, random_generator):
+    # Adversarial: a few distinct small amounts, giving a huge number of
+    # zero-sum selections to choose from
+    return with_last_balance_settling([random_generator.randint(-5, 5) * 100 for _ in range(size - 1)])
+
+
+GROUPS = {
+    "random": random_group,
+    "one_payer": one_payer_group,
+    "pairs": pairs_group,
+    "no_subgroup": no_subgroup_group,
+    "small_amounts": small_amounts_group,
+}
+
+
+def is_settled(balances, settlement):
+    left = dict(balances)
+    for transfer in settlement.transfers:
+        left[transfer.borrower] -= transfer.cents
+        left[transfer.lender] += transfer.cents
+    return not any(left.values())
+
+
+def measure(balances, strategy, repeat, time_budget):
+    # The peak memory is measured on a run of its own, tracing allocations
+    # slows the run down
+    tracemalloc.start()
+    settle(balances, strategy=strategy, time_budget=time_budget)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        settlement = settle(balances, strategy=strategy, time_budget=time_budget)
+        durations.append(time.perf_counter() - start)
+    return {
+        "seconds": min(durations),
+        "peak_memory": peak_memory,
+        "transfers": len(settlement.transfers),
+        "optimal": settlement.optimal,
+        "settled": is_settled(balances, settlement),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, groups=tuple(GROUPS), strategies=tuple(STRATEGIES), repeat=1, time_budget=None):
+    results = []
+    for group in groups:
+        for size in sizes:
+            balances = GROUPS[group](size, random.Random(size))
+            for strategy in strategies:
+                results.append(
+                    {"group": group, "size": size, "strategy": strategy}
+                    | measure(balances, strategy, repeat, time_budget)
+                )
+    return results
+
+
+def print_results(results):
+    print(f"{'group':<14}{'size':>6}  {'strategy':<10}{'ms':>10}{'peak KiB':>10}{'transfers':>11}  optimal  settled")
+    for result in results:
+        print(
+            f"{result['group']:<14}{result['size']:>6}  {result['strategy']:<10}"
+            f"{result['seconds'] * 1000:>10.2f}{result['peak_memory'] / 1024:>10.1f}{result['transfers']:>11}"
+            f"  {str(result['optimal']):<7}  {result['settled']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the settlement strategies on synthetic groups.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=tuple(GROUPS))
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=tuple(STRATEGIES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--time-budget", type=float, default=None, help="in seconds, no limit by default")
+    arguments = parser.parse_args()
+
+    print_results(
+        run_benchmark(
+            sizes=arguments.sizes,
+            groups=arguments.groups,
+            strategies=arguments.strategies,
+            repeat=arguments.repeat,
+            time_budget=arguments.time_budget,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,144 +1,174 @@
-from copy import deepcopy
-
-from split_free_backend.core.models import Balance, Debt
-
-
-def get_selection_with_sum(target_sum, selection_length, balances):
-    # This is the case where we try to get all balance of balances to sum up to 0
-    if selection_length == len(balances) and target_sum == 0:
-        return balances
-    # For a selection of 1 balance, let's return the first balance that is equal
-    # to the target sum
-    if selection_length == 1:
-        for balance in balances:
-            if balance.amount == target_sum:
-                return [balance]
-        # If no selection of one balance is found return an empty list
-        return []
-
-    # For a selection of 2 balances, let's have two indices one at the beginning
-    # and one at the end of balances and move them until they sum up to the
-    # target or overlap.
-    # Remember that this is possible because the balances list is sorted at any
-    # point of the algorithm.
-    if selection_length == 2:
-        low_index = 0
-        high_index = len(balances) - 1
-        while low_index < high_index:
-            sum_balances = balances[low_index].amount + balances[high_index].amount
-            if sum_balances < 0:
-                low_index += 1
-            elif sum_balances > 0:
-                high_index -= 1
-            else:
-                return [balances[low_index], balances[high_index]]
-        # If no selection of 2 balances is found return an empty list
-        return []
-
-    # For a selection of more than 2 balances, let's operate recursively to
-    # lower values of selection_length: loop through the array this an index
-    # first_index, and try to target the sum
-    # (target_sum - balances[first_index].balance) with
-    # selection_length-1 balances in the array starting from after this
-    # first_index
-    for first_index in range(len(balances) - (selection_length - 1)):
-        potential_matching_selection = get_selection_with_sum(
-            target_sum=target_sum - float(balances[first_index].amount),
-            balances=balances[first_index + 1 :],
-            selection_length=selection_length - 1,
-        )
-        if potential_matching_selection:
-            return [balances[first_index]] + potential_matching_selection
-
-    # If no matching selection is found return an empty list
-    return []
-
-
-def remove_selection_from_balances(balances, selection):
-    selected_balance_ids = set(balance.id for balance in selection)
-    new_balances = []
-    for balance in balances:
-        if balance.id not in selected_balance_ids:
-            new_balances.append(balance)
-    return new_balances
-
-
-def get_debts_from(selection):
-    if len(selection) < 2:
-        return []
-    # As the balances in the selection are sorted according to their amount,
-    # let's consider the first and the last one, one will be positive and the
-    # other one negative. Let's make them match into a debt so that the one with
-    # the smallest absolute value is removed and the one with the greatest
-    # absolute value is kept with what's left. In case they cancel out, they
-    # both disappear
-    debts = []
-    while selection:
-        debt = Debt(
-            group=selection[0].group,
-            borrower=selection[-1].owner,
-            lender=selection[0].owner,
-        )
-        # The first element is negative and the last positive, we sum them to
-        # "get the difference" and judge which one has more "weight"
-        difference = selection[0].amount + selection[-1].amount
-        if difference < 0:
-            # Example selection[0] -> -100 and selection[-1] -> +10
-            debt.amount = selection[-1].amount
-            selection[0].amount = difference
-            selection.pop()
-        elif difference > 0:
-            # Example selection[0] -> -10 and selection[-1] -> +100
-            debt.amount = -selection[0].amount
-            selection[-1].amount = difference
-            selection.pop(0)
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from split_free_backend.core.models import Balance, Debt, Group
+from split_free_backend.core.money import from_cents, to_cents
+from split_free_backend.core.settlement import (
+    STRATEGIES,
+    SettlementCache,
+    settle_partitions,
+)
+
+
+def match_debts(debts, existing_debts, key):
+    # Pair up the (borrower_id, lender_id, amount, currency) debts with
+    # existing Debt objects having the same `key`. Returns the pairs, the debts
+    # left over and the existing debts left over
+    existing_by_key = {}
+    for debt in existing_debts:
+        existing_by_key.setdefault(key(debt.borrower_id, debt.lender_id, debt.amount, debt.currency), []).append(debt)
+    pairs = []
+    debts_left = []
+    for debt in debts:
+        same_key_debts = existing_by_key.get(key(*debt))
+        if same_key_debts:
+            pairs.append((debt, same_key_debts.pop()))
         else:
-            # Example selection[0] -> -100 and selection[-1] -> +100
-            debt.amount = selection[-1].amount
-            selection.pop(0)
-            selection.pop()
-        debts.append(debt)
-    return debts
-
-
-def calculate_new_debts(group):
-    unsorted_balances = Balance.objects.filter(group=group)
-    # Let's sort the balances according to their amount
-    balances = deepcopy(sorted(unsorted_balances, key=lambda balance: balance.amount))
-
-    # This is where the debts are stored
-    debts = []
-    # Let's select balances of 1, 2, ... len(balances)//2 balances into a
-    # `selection`. The length of a selection is called selection_length
-    selection_length = 1
-    while balances:
-        # If no selections of null sum could be found with less than
-        # 'len(balances) // 2' , there won't be selections of more than that
-        if selection_length > len(balances) // 2:
-            selection_length = len(balances)
-        # Try to find a selection of length: selection_length
-        selection = get_selection_with_sum(
-            target_sum=0.00,
-            selection_length=selection_length,
-            balances=balances,
+            debts_left.append(debt)
+    return pairs, debts_left, [debt for same_key_debts in existing_by_key.values() for debt in same_key_debts]
+
+
+def get_debt_changes(group_id, existing_debts, debts):
+    # The writes making the `existing_debts` Debt objects of a group match
+    # `debts`, a list of (borrower_id, lender_id, amount, currency), with as
+    # few writes as possible. Returns the debts to update, to insert and to
+    # delete, all empty when nothing changed.
+
+    # The debts that are already there are left untouched
+    _, debts, outdated_debts = match_debts(debts, existing_debts, key=lambda *debt: debt)
+    if not debts and not outdated_debts:
+        return [], [], []
+
+    # Prefer updating the amount of a debt between the same members in the
+    # same currency, then recycling the other outdated debts, and only then
+    # inserting or deleting
+    pairs, debts, outdated_debts = match_debts(
+        debts, outdated_debts, key=lambda borrower_id, lender_id, amount, currency: (borrower_id, lender_id, currency)
+    )
+    pairs.extend(zip(debts, outdated_debts))
+    new_debts = [
+        Debt(group_id=group_id, borrower_id=borrower_id, lender_id=lender_id, amount=amount, currency=currency)
+        for borrower_id, lender_id, amount, currency in debts[len(outdated_debts) :]
+    ]
+    deleted_debts = outdated_debts[len(debts) :]
+
+    for (borrower_id, lender_id, amount, currency), debt in pairs:
+        debt.borrower_id, debt.lender_id, debt.amount, debt.currency = borrower_id, lender_id, amount, currency
+    return [debt for _, debt in pairs], new_debts, deleted_debts
+
+
+def apply_debt_changes(updated_debts, new_debts, deleted_debts):
+    # Write the changes from `get_debt_changes`, possibly gathered across
+    # several groups
+    if deleted_debts:
+        Debt.objects.filter(id__in=[debt.id for debt in deleted_debts]).delete()
+    if updated_debts:
+        Debt.objects.bulk_update(updated_debts, ["borrower", "lender", "amount", "currency"])
+    if new_debts:
+        Debt.objects.bulk_create(new_debts)
+
+
+def save_debts(group, debts):
+    # Make the debts of the group match `debts`. Returns whether anything
+    # changed.
+    changes = get_debt_changes(group.pk, Debt.objects.filter(group=group).order_by("id"), debts)
+    apply_debt_changes(*changes)
+    return any(changes)
+
+
+def get_partitions(balances):
+    # Members only owe each other in the same currency, so each currency is
+    # settled on its own. Splits the (owner_id, amount, currency) balances into
+    # lists of (owner_id, cents) per currency.
+    partitions = {}
+    for owner_id, amount, currency in balances:
+        partitions.setdefault(currency, []).append((owner_id, to_cents(amount)))
+    return partitions
+
+
+def get_settled_debts(settlements):
+    # The (borrower_id, lender_id, amount, currency) debts of the settlements
+    # per currency, back in decimal amounts
+    return [
+        (transfer.borrower, transfer.lender, from_cents(transfer.cents), currency)
+        for currency, settlement in settlements.items()
+        for transfer in settlement.transfers
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_settlement_cache():
+    # The settlements cache of the process, None when disabled
+    if not settings.DEBTS_SETTLEMENT_CACHE_SIZE:
+        return None
+    backend = settings.DEBTS_SETTLEMENT_CACHE_BACKEND
+    return SettlementCache(
+        maxsize=settings.DEBTS_SETTLEMENT_CACHE_SIZE,
+        backend=caches[backend] if backend else None,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_settlement_executor():
+    # The worker processes settling the currencies of a group concurrently,
+    # None when disabled
+    if not settings.DEBTS_SETTLEMENT_WORKERS:
+        return None
+    return ProcessPoolExecutor(max_workers=settings.DEBTS_SETTLEMENT_WORKERS)
+
+
+def settle_balances(partitions, strategy, time_budget):
+    # Settle the partitions on the worker processes when enabled. A worker
+    # dying, e.g. killed for its memory, breaks them for good: they are
+    # replaced for the next settlements and these ones are settled here.
+    settle = partial(
+        settle_partitions, partitions, strategy=strategy, time_budget=time_budget, cache=get_settlement_cache()
+    )
+    executor = get_settlement_executor()
+    try:
+        return settle(executor=executor)
+    except BrokenProcessPool:
+        executor.shutdown(wait=False)
+        get_settlement_executor.cache_clear()
+        return settle(executor=None)
+
+
+def get_strategy(strategy, number_of_members):
+    if strategy == "auto":
+        strategy = "exact" if number_of_members <= settings.DEBTS_SETTLEMENT_EXACT_MAX_MEMBERS else "vectorized"
+    # The vectorized strategy is not available without NumPy
+    if strategy not in STRATEGIES:
+        strategy = "greedy"
+    return strategy
+
+
+def calculate_new_debts(group, time_budget=None):
+    if time_budget is None:
+        time_budget = settings.DEBTS_SETTLEMENT_TIME_BUDGET
+
+    partitions = get_partitions(Balance.objects.filter(group=group).values_list("owner_id", "amount", "currency"))
+    settlements = settle_balances(
+        partitions,
+        get_strategy(group.settlement_strategy, sum(len(partition) for partition in partitions.values())),
+        time_budget,
+    )
+
+    changed = save_debts(group, get_settled_debts(settlements))
+
+    # Let the clients know when the debts could be simplified further and that
+    # they are up to date, with a new version of the group as any of these
+    # changes is seen by its clients. The writes to the group being
+    # serialized, its version can't change meanwhile.
+    optimal = all(settlement.optimal for settlement in settlements.values())
+    if changed or group.debts_optimal != optimal or group.debts_version != group.version:
+        group.debts_optimal = optimal
+        group.version += 1
+        group.debts_version = group.version
+        Group.objects.filter(pk=group.pk).update(
+            debts_optimal=optimal, version=F("version") + 1, debts_version=F("version") + 1
         )
-        # If none is found, let's increment the counter of selection_length
-        if not selection:
-            selection_length += 1
-        # If one is found, next iteration, we'll try to extract another
-        # selection of length: selection_length
-        else:
-            # Remove the balances of the found selection from the balances, so
-            # that we need to deal with only the leftover balances
-            balances = remove_selection_from_balances(balances=balances, selection=selection)
-            # Extract the debts from this selection. As non of its
-            # sub-selections can sum to 0, we get (selection-length - 1)
-            # debts out of this selection
-            debts.extend(get_debts_from(selection=selection))
-
-    # Let's remove the old debts from the database
-    Debt.objects.filter(group=group).delete()
-
-    # Save the debts in database
-    for debt in debts:
-        debt.save()
@@ -0,0 +1,53 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# With DEBTS_RECOMPUTE_ASYNC the requests don't recompute the debts of the
+# groups they change, they queue a job in the database instead and the
+# run_debt_worker command recomputes them. Clients can tell the debts of a
+# group are up to date when its debts_version is its version.
+
+from django.db import transaction
+
+from split_free_backend.core.algo_debts import calculate_new_debts
+from split_free_backend.core.locking import lock_groups
+from split_free_backend.core.models import DebtRecomputeJob, Group
+
+
+def enqueue_debts_recompute(group_ids):
+    DebtRecomputeJob.objects.bulk_create([DebtRecomputeJob(group_id=group_id) for group_id in sorted(group_ids)])
+
+
+def claim_jobs(batch_size):
+    # Lock the oldest jobs no other worker is processing, along with the other
+    # pending jobs of the same groups, so each group is recomputed once.
+    # Returns the ids of the jobs and of their groups.
+    group_ids = set(
+        DebtRecomputeJob.objects.select_for_update(skip_locked=True)
+        .order_by("id")
+        .values_list("group_id", flat=True)[:batch_size]
+    )
+    if not group_ids:
+        return [], set()
+    job_ids = list(
+        DebtRecomputeJob.objects.select_for_update(skip_locked=True)
+        .filter(group_id__in=group_ids)
+        .values_list("id", flat=True)
+    )
+    return job_ids, group_ids
+
+
+def run_batch(batch_size=100):
+    # Recompute the debts of up to `batch_size` queued groups, each in its own
+    # transaction so the requests to a group only wait for its recompute.
+    # Returns the number of groups recomputed, 0 when the queue is empty.
+    recomputed = 0
+    while recomputed < batch_size:
+        with transaction.atomic():
+            job_ids, group_ids = claim_jobs(1)
+            if not job_ids:
+                break
+            lock_groups(group_ids)
+            for group in Group.objects.filter(pk__in=group_ids):
+                calculate_new_debts(group=group)
+            DebtRecomputeJob.objects.filter(id__in=job_ids).delete()
+        recomputed += len(group_ids)
+    return recomputed
@@ -0,0 +1,121 @@
+# Copyright (c) 2024 SplitFree Org.
+from decimal import Decimal
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+from split_free_backend.core.money import to_cents
+from split_free_backend.core.serializers import AmountField
+
+# Fields represented by the value read from the database as it is
+PLAIN_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+    PrimaryKeyRelatedField,
+)
+
+
+def get_decimal_converter(field):
+    coerce_to_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        return field.to_representation
+    # The amounts fit in the field, the quantization only adds the missing
+    # decimal places
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+    rounding = field.rounding
+
+    def convert(value):
+        return f"{value.quantize(exponent, rounding=rounding):f}"
+
+    return convert
+
+
+def get_converter(field, amounts_in_cents):
+    # The function turning a value read from the database into the
+    # representation of `field`, None when there is nothing to convert
+    if amounts_in_cents and isinstance(field, AmountField):
+        return to_cents
+    if isinstance(field, PLAIN_FIELDS):
+        return None
+    if isinstance(field, serializers.ChoiceField) and all(isinstance(choice, str) for choice in field.choices):
+        return None
+    if isinstance(field, serializers.DecimalField):
+        return get_decimal_converter(field)
+    return field.to_representation
+
+
+class ValuesSerializer:
+    # Serializes the rows of a queryset the same way as a model serializer
+    # listing them, for reading only, from the columns it needs rather than
+    # from model instances. Only the fields of the model itself and the many to
+    # many relations listed by primary key are supported.
+    def __init__(self, serializer_class, amounts_in_cents=False):
+        model = serializer_class.Meta.model
+        self.columns = []
+        self.many_to_many = []
+        # (field name, index of the column or None, converter or many to many field)
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if "." in field.source or field.source == "*":
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is not a field of the model")
+            if isinstance(field, ManyRelatedField):
+                model_field = model._meta.get_field(field.source)
+                if not isinstance(model_field, models.ManyToManyField) or not isinstance(
+                    field.child_relation, PrimaryKeyRelatedField
+                ):
+                    raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is not listed by primary key")
+                self.many_to_many.append(model_field)
+                self.fields.append((name, None, model_field))
+            elif isinstance(field, serializers.BaseSerializer):
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is a nested serializer")
+            else:
+                self.fields.append((name, len(self.columns), get_converter(field, amounts_in_cents)))
+                self.columns.append(field.source)
+        self.columns.append("pk")
+
+    def get_related_ids(self, model_field, pks):
+        # The ids of the related objects of each row, in the order of their
+        # ids like the views prefetch them
+        through = model_field.remote_field.through
+        source_column = f"{model_field.m2m_field_name()}_id"
+        target_column = f"{model_field.m2m_reverse_field_name()}_id"
+        related_ids = {}
+        for pk, related_id in (
+            through.objects.filter(**{f"{source_column}__in": pks})
+            .order_by(source_column, target_column)
+            .values_list(source_column, target_column)
+        ):
+            related_ids.setdefault(pk, []).append(related_id)
+        return related_ids
+
+    def serialize(self, queryset):
+        # The prefetches are replaced by the queries of the related ids
+        rows = list(queryset.prefetch_related(None).values_list(*self.columns))
+        pks = [row[-1] for row in rows]
+        related_ids = {
+            model_field: self.get_related_ids(model_field, pks) for model_field in self.many_to_many if rows
+        }
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, converter in self.fields:
+                if index is None:
+                    item[name] = related_ids[converter].get(row[-1], [])
+                    continue
+                value = row[index]
+                item[name] = value if value is None or converter is None else converter(value)
+            data.append(item)
+        return data
+
+
+@lru_cache(maxsize=None)
+def get_values_serializer(serializer_class, amounts_in_cents=False):
+    return ValuesSerializer(serializer_class, amounts_in_cents)
@@ -0,0 +1,60 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# The balances are a cache of the expense shares ledger: they are only ever
+# written from the sum of the ledger rows of their member, so they can be
+# rebuilt at any time with a single aggregate.
+
+from django.db.models import F, Sum
+
+from split_free_backend.core.models import Balance, ExpenseShare
+from split_free_backend.core.money import allocate_cents, from_cents, to_cents
+
+
+def get_expense_shares(expense_info):
+    # The ledger rows of an expense. In case the payer paid and left, it's
+    # free for the other members of the expense. The cents left over by an
+    # uneven split go to the participants created first.
+    if not expense_info["payer"] or not expense_info["participants"]:
+        return []
+
+    cents = to_cents(expense_info["amount"])
+    shares = {}
+    participants = sorted(expense_info["participants"], key=lambda member: member.pk)
+    for member, owed_cents in zip(participants, allocate_cents(cents, [1] * len(participants))):
+        shares[member.pk] = ExpenseShare(member_id=member.pk, owed_cents=owed_cents)
+    shares.setdefault(expense_info["payer"], ExpenseShare(member_id=expense_info["payer"])).paid_cents = cents
+    for share in shares.values():
+        share.expense_id = expense_info["id"]
+        share.group_id = expense_info["group"]
+        share.currency = expense_info["currency"]
+    return list(shares.values())
+
+
+def get_ledger_balances(group_ids):
+    # The balance of each member of the groups in each currency according to
+    # the ledger, in cents, as (member_id, group_id, currency, cents) rows.
+    # The currencies a member has no ledger rows in are missing.
+    return list(
+        ExpenseShare.objects.filter(group_id__in=group_ids)
+        .values("member_id", "group_id", "currency")
+        .annotate(cents=Sum(F("owed_cents") - F("paid_cents")))
+        .order_by()
+        .values_list("member_id", "group_id", "currency", "cents")
+    )
+
+
+def refresh_balances(group_ids):
+    # Rebuild the balances of the groups from the ledger, in three queries: the
+    # balances of the ledger are inserted or updated, the others are zeroed
+    balances = Balance.objects.bulk_create(
+        [
+            Balance(owner_id=member_id, group_id=group_id, currency=currency, amount=from_cents(cents))
+            for member_id, group_id, currency, cents in get_ledger_balances(group_ids)
+        ],
+        update_conflicts=True,
+        unique_fields=["owner", "currency"],
+        update_fields=["amount"],
+    )
+    Balance.objects.filter(group_id__in=group_ids).exclude(pk__in=[balance.pk for balance in balances]).exclude(
+        amount=0
+    ).update(amount=from_cents(0))
@@ -0,0 +1,68 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router
+
+from split_free_backend.core.models import Balance, Group
+
+logger = logging.getLogger("core.locking")
+
+# First key of the PostgreSQL advisory locks of the groups, the group id being
+# the second one
+GROUP_LOCK_NAMESPACE = 0x5F12EE
+
+
+class LockWaits:
+    # Number of times the groups were locked and seconds spent waiting for
+    # their locks, for the `maxsize` groups locked most recently
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.groups = OrderedDict()
+
+    def record(self, group_id, seconds):
+        locks, wait = self.groups.pop(group_id, (0, 0.0))
+        self.groups[group_id] = (locks + 1, wait + seconds)
+        if len(self.groups) > self.maxsize:
+            self.groups.popitem(last=False)
+
+    def stats(self):
+        return {group_id: {"locks": locks, "wait": wait} for group_id, (locks, wait) in self.groups.items()}
+
+    def clear(self):
+        self.groups.clear()
+
+
+lock_waits = LockWaits()
+
+
+def lock_groups(group_ids):
+    # Serialize the writes to the balances and debts of the groups until the
+    # end of the current transaction. Nothing is locked outside of a
+    # transaction, the locks would be released right away.
+    mode = settings.GROUP_WRITE_LOCK
+    connection = connections[router.db_for_write(Group)]
+    if not mode or not connection.in_atomic_block:
+        return
+
+    # Everyone locks the groups, and then their balances, by increasing id so
+    # concurrent writers queue up instead of deadlocking. The rows may be
+    # locked after an insert referencing them: FOR NO KEY UPDATE doesn't
+    # conflict with the key share lock of its foreign key check.
+    for group_id in sorted(set(group_ids)):
+        start = time.monotonic()
+        if mode == "advisory" and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [GROUP_LOCK_NAMESPACE, group_id])
+        else:
+            list(Group.objects.select_for_update(no_key=True).filter(pk=group_id).values_list("pk", flat=True))
+        balances = Balance.objects.select_for_update(no_key=True).filter(group_id=group_id).order_by("pk")
+        list(balances.values_list("pk", flat=True))
+
+        wait = time.monotonic() - start
+        lock_waits.record(group_id, wait)
+        if wait > settings.GROUP_WRITE_LOCK_SLOW_WAIT:
+            logger.warning("Waited %.3fs for the lock of group %s", wait, group_id)
@@ -0,0 +1,250 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import multiprocessing
+import os
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from split_free_backend.core.algo_debts import (
+    apply_debt_changes,
+    calculate_new_debts,
+    get_debt_changes,
+    get_partitions,
+    get_settled_debts,
+    get_strategy,
+)
+from split_free_backend.core.ledger import refresh_balances
+from split_free_backend.core.locking import lock_groups
+from split_free_backend.core.models import Balance, Debt, Group
+from split_free_backend.core.settlement import settle_partitions
+from split_free_backend.core.unit_of_work import bump_versions
+
+
+def settle_group(job):
+    # Runs in the worker processes, so it must not touch the database
+    partitions, strategy, time_budget = job
+    return settle_partitions(partitions, strategy=strategy, time_budget=time_budget)
+
+
+def get_chunk(groups, chunk_size):
+    return list(
+        groups.order_by("id").values_list("id", "settlement_strategy", "debts_optimal", "version")[:chunk_size]
+    )
+
+
+def read_checkpoint(path):
+    # The id of the last group recomputed, 0 to start from the first group
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint:
+        return int(checkpoint.read().strip() or 0)
+
+
+def write_checkpoint(path, group_id):
+    # Replace the file at once so an interrupted run never leaves it truncated
+    with open(f"{path}.tmp", "w") as checkpoint:
+        checkpoint.write(str(group_id))
+    os.replace(f"{path}.tmp", path)
+
+
+class Command(BaseCommand):
+    help = "Recompute the debts of every group, e.g. after a change of the settlement algorithm or a data repair"
+    # Number of times the groups changed during the recompute are recomputed
+    # again, before being recomputed with their lock held
+    retries = 2
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of groups recomputed at once")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes settling the debts, 0 to settle them in this process",
+        )
+        parser.add_argument(
+            "--time-budget",
+            type=float,
+            default=None,
+            help="Seconds allowed to settle the debts of each currency of a group exactly",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording the last group recomputed, the next run resumes from it",
+        )
+        parser.add_argument(
+            "--refresh-balances",
+            action="store_true",
+            help="Rebuild the balances from the expense shares ledger first, ignored with --dry-run",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report the groups whose debts would change")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        time_budget = options["time_budget"]
+        if time_budget is None:
+            time_budget = settings.DEBTS_SETTLEMENT_TIME_BUDGET
+        checkpoint = options["checkpoint"]
+        dry_run = options["dry_run"]
+        refresh = options["refresh_balances"] and not dry_run
+
+        last_group_id = read_checkpoint(checkpoint)
+        if last_group_id:
+            self.stdout.write(f"Resuming after group {last_group_id}")
+        total = Group.objects.filter(id__gt=last_group_id).count()
+        done = changed = 0
+        retried_group_ids = []
+
+        # The workers are forked, they must not share the connections of this
+        # process
+        pool = None
+        if options["processes"]:
+            connections.close_all()
+            pool = multiprocessing.Pool(options["processes"])
+        try:
+            while True:
+                groups = get_chunk(Group.objects.filter(id__gt=last_group_id), chunk_size)
+                if not groups:
+                    break
+                changed_group_ids, skipped_group_ids = self.recompute_chunk(
+                    groups, pool, time_budget, dry_run, refresh
+                )
+                retried_group_ids.extend(skipped_group_ids)
+
+                # A resumed run starts over from the first group to retry
+                last_group_id = groups[-1][0]
+                if checkpoint and not dry_run:
+                    write_checkpoint(checkpoint, min([last_group_id, *(i - 1 for i in retried_group_ids)]))
+                done += len(groups)
+                changed += len(changed_group_ids)
+                self.stdout.write(f"{done}/{total} groups recomputed, {changed} with new debts")
+
+            if retried_group_ids:
+                changed += self.retry_groups(retried_group_ids, chunk_size, pool, time_budget, refresh)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        if checkpoint and not dry_run and done:
+            write_checkpoint(checkpoint, last_group_id)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{changed} of {done} groups {'would have' if dry_run else 'got'} new debts")
+        )
+
+    def retry_groups(self, group_ids, chunk_size, pool, time_budget, refresh):
+        # Recompute the debts of the groups changed during the recompute again,
+        # and then with their lock held, as the requests changing them do, for
+        # those changing all along. Returns the number of groups whose debts
+        # changed.
+        changed = 0
+        for _ in range(self.retries):
+            self.stdout.write(f"Retrying {len(group_ids)} groups changed during the recompute")
+            skipped_group_ids = []
+            for start in range(0, len(group_ids), chunk_size):
+                groups = get_chunk(Group.objects.filter(id__in=group_ids[start : start + chunk_size]), chunk_size)
+                changed_group_ids, skipped = self.recompute_chunk(groups, pool, time_budget, False, refresh)
+                skipped_group_ids.extend(skipped)
+                changed += len(changed_group_ids)
+            group_ids = skipped_group_ids
+            if not group_ids:
+                return changed
+
+        for group_id in group_ids:
+            with transaction.atomic():
+                lock_groups([group_id])
+                for group in Group.objects.filter(pk=group_id):
+                    calculate_new_debts(group, time_budget)
+            self.stdout.write(f"Group {group_id}: debts recomputed with the group locked")
+        return changed
+
+    def recompute_chunk(self, groups, pool, time_budget, dry_run, refresh):
+        # Recompute the debts of the (id, settlement_strategy, debts_optimal,
+        # version) groups, with a constant number of queries besides the locks.
+        # Returns the ids of the groups whose debts changed, and of the groups
+        # changed meanwhile, left as they were.
+        group_ids = [group_id for group_id, _, _, _ in groups]
+        versions = {group_id: version for group_id, _, _, version in groups}
+        if refresh:
+            with transaction.atomic():
+                lock_groups(group_ids)
+                refresh_balances(group_ids)
+                bump_versions(group_ids)
+            versions = dict(Group.objects.filter(id__in=group_ids).values_list("id", "version"))
+
+        # The groups are not locked while their debts are settled, the groups
+        # changed meanwhile are skipped. The versions being read first, the
+        # balances read are at least as recent.
+        partitions = dict.fromkeys(group_ids, {})
+        balances = (
+            Balance.objects.filter(group_id__in=group_ids)
+            .order_by("group_id")
+            .values_list("group_id", "owner_id", "amount", "currency")
+        )
+        for group_id, group_balances in groupby(balances, key=itemgetter(0)):
+            partitions[group_id] = get_partitions(balance[1:] for balance in group_balances)
+        existing_debts = {}
+        for debt in Debt.objects.filter(group_id__in=group_ids).order_by("id"):
+            existing_debts.setdefault(debt.group_id, []).append(debt)
+
+        # Settling is CPU bound, it goes to the worker processes
+        jobs = [
+            (
+                partitions[group_id],
+                get_strategy(strategy, sum(len(partition) for partition in partitions[group_id].values())),
+                time_budget,
+            )
+            for group_id, strategy, _, _ in groups
+        ]
+        results = list(pool.map(settle_group, jobs) if pool else map(settle_group, jobs))
+
+        if dry_run:
+            changed_group_ids = self.get_changes(groups, existing_debts, results)[0]
+            for group_id in changed_group_ids:
+                self.stdout.write(f"Group {group_id}: debts would change")
+            return changed_group_ids, []
+        with transaction.atomic():
+            lock_groups(group_ids)
+            current_versions = dict(Group.objects.filter(id__in=group_ids).values_list("id", "version"))
+            skipped_group_ids = {
+                group_id for group_id in group_ids if current_versions.get(group_id) != versions[group_id]
+            }
+            skipped_group_ids = sorted(skipped_group_ids)
+            for group_id in skipped_group_ids:
+                self.stdout.write(f"Group {group_id}: skipped, changed during the recompute")
+            changed_group_ids, optimal_group_ids, changes = self.get_changes(
+                groups, existing_debts, results, skipped_group_ids
+            )
+            apply_debt_changes(*changes)
+            for optimal, optimal_ids in optimal_group_ids.items():
+                if optimal_ids:
+                    Group.objects.filter(id__in=optimal_ids).update(debts_optimal=optimal)
+            # The clients get the new debts, and whether they are the fewest
+            bump_versions(set(changed_group_ids).union(*optimal_group_ids.values()))
+        for group_id in changed_group_ids:
+            self.stdout.write(f"Group {group_id}: debts changed")
+        return changed_group_ids, skipped_group_ids
+
+    def get_changes(self, groups, existing_debts, results, skipped_group_ids=()):
+        # The ids of the groups whose debts changed, the ids of the groups per
+        # new debts_optimal, and the debts to update, insert and delete
+        changed_group_ids = []
+        optimal_group_ids = {True: [], False: []}
+        updated_debts, new_debts, deleted_debts = [], [], []
+        for (group_id, _, debts_optimal, _), settlements in zip(groups, results):
+            if group_id in skipped_group_ids:
+                continue
+            optimal = all(settlement.optimal for settlement in settlements.values())
+            if debts_optimal != optimal:
+                optimal_group_ids[optimal].append(group_id)
+            changes = get_debt_changes(group_id, existing_debts.get(group_id, []), get_settled_debts(settlements))
+            if any(changes):
+                changed_group_ids.append(group_id)
+                updated_debts.extend(changes[0])
+                new_debts.extend(changes[1])
+                deleted_debts.extend(changes[2])
+        return changed_group_ids, optimal_group_ids, (updated_debts, new_debts, deleted_debts)
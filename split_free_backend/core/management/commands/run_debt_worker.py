@@ -0,0 +1,31 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from split_free_backend.core.debt_queue import run_batch
+
+
+class Command(BaseCommand):
+    help = "Recompute the debts of the groups queued by the requests, with DEBTS_RECOMPUTE_ASYNC"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Number of groups recomputed between two reports"
+        )
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Stop when the queue is empty")
+
+    def handle(self, *args, **options):
+        recomputed = 0
+        while True:
+            groups = run_batch(options["batch_size"])
+            if groups:
+                recomputed += groups
+                self.stdout.write(f"Recomputed the debts of {groups} groups")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed the debts of {recomputed} groups in total"))
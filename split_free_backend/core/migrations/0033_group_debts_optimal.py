@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-17 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0032_rename_hash_invitetoken_token_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="debts_optimal",
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0033_group_debts_optimal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="settlement_strategy",
+            field=models.CharField(
+                choices=[
+                    ("auto", "Automatic"),
+                    ("exact", "Fewest debts"),
+                    ("greedy", "Greedy"),
+                    ("vectorized", "Greedy, vectorized"),
+                ],
+                default="auto",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.3 on 2026-10-17 01:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0034_group_settlement_strategy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExpenseShare",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("paid_cents", models.BigIntegerField(default=0)),
+                ("owed_cents", models.BigIntegerField(default=0)),
+                (
+                    "expense",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shares",
+                        to="core.expense",
+                    ),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to="core.group"),
+                ),
+                (
+                    "member",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="expense_shares", to="core.member"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["group", "member"], name="core_expens_group_i_949bfe_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="expenseshare",
+            constraint=models.UniqueConstraint(fields=("expense", "member"), name="unique_expense_share"),
+        ),
+    ]
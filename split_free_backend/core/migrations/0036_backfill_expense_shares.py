@@ -0,0 +1,61 @@
+# Generated by Django 5.0.3 on 2026-10-17 01:57
+
+from django.db import migrations
+
+from split_free_backend.core.money import allocate_cents, to_cents
+
+
+def backfill_expense_shares(apps, schema_editor):
+    Balance = apps.get_model("core", "Balance")
+    Expense = apps.get_model("core", "Expense")
+    ExpenseShare = apps.get_model("core", "ExpenseShare")
+
+    # The shares of every expense, split the way the signals do
+    ledger_balances = {}
+    shares = []
+    for expense in (
+        Expense.objects.filter(payer__isnull=False).prefetch_related("participants").iterator(chunk_size=500)
+    ):
+        participants = sorted(expense.participants.all(), key=lambda member: member.pk)
+        if not participants:
+            continue
+        cents = to_cents(expense.amount)
+        expense_shares = {}
+        for member, owed_cents in zip(participants, allocate_cents(cents, [1] * len(participants))):
+            expense_shares[member.pk] = ExpenseShare(
+                expense=expense, member_id=member.pk, group_id=expense.group_id, owed_cents=owed_cents
+            )
+        expense_shares.setdefault(
+            expense.payer_id, ExpenseShare(expense=expense, member_id=expense.payer_id, group_id=expense.group_id)
+        ).paid_cents = cents
+        for share in expense_shares.values():
+            ledger_balances[share.member_id] = (
+                ledger_balances.get(share.member_id, 0) + share.owed_cents - share.paid_cents
+            )
+        shares.extend(expense_shares.values())
+
+    # The balances are left as they are: what the expenses don't explain, like
+    # the debts written off when members left, is kept as a row with no expense
+    for balance in Balance.objects.filter(owner__isnull=False):
+        cents = to_cents(balance.amount) - ledger_balances.get(balance.owner_id, 0)
+        if cents:
+            shares.append(
+                ExpenseShare(
+                    member_id=balance.owner_id,
+                    group_id=balance.group_id,
+                    owed_cents=max(cents, 0),
+                    paid_cents=max(-cents, 0),
+                )
+            )
+    ExpenseShare.objects.bulk_create(shares, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0035_expenseshare"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_expense_shares, migrations.RunPython.noop),
+    ]
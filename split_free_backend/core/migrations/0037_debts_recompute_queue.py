@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-17 02:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0036_backfill_expense_shares"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="group",
+            name="debts_version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="DebtRecomputeJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="debt_recompute_jobs",
+                        to="core.group",
+                    ),
+                ),
+            ],
+        ),
+    ]
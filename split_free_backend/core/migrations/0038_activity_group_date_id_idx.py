@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0037_debts_recompute_queue"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["group", "-date", "-id"], name="activity_group_date_id_idx"),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.3 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from split_free_backend.core.money import from_cents
+
+
+def split_balances_per_currency(apps, schema_editor):
+    Balance = apps.get_model("core", "Balance")
+    Expense = apps.get_model("core", "Expense")
+    ExpenseShare = apps.get_model("core", "ExpenseShare")
+
+    # The ledger rows take the currency of their expense, the debts written
+    # off having always been in euros
+    ExpenseShare.objects.filter(expense__isnull=False).update(
+        currency=Subquery(Expense.objects.filter(pk=OuterRef("expense_id")).values("currency")[:1])
+    )
+
+    # The balances summed up every currency, rebuild them from the ledger
+    Balance.objects.update(amount=0)
+    Balance.objects.bulk_create(
+        [
+            Balance(owner_id=member_id, group_id=group_id, currency=currency, amount=from_cents(cents))
+            for member_id, group_id, currency, cents in ExpenseShare.objects.values(
+                "member_id", "group_id", "currency"
+            )
+            .annotate(cents=Sum(F("owed_cents") - F("paid_cents")))
+            .order_by()
+            .values_list("member_id", "group_id", "currency", "cents")
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["owner", "currency"],
+        update_fields=["amount"],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0038_activity_group_date_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expenseshare",
+            name="currency",
+            field=models.CharField(
+                choices=[("EUR", "Euro"), ("USD", "US Dollar"), ("GBP", "British Pound"), ("TRY", "Turkish lira")],
+                default="EUR",
+                max_length=4,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="balance",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="balances",
+                to="core.member",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="balance",
+            constraint=models.UniqueConstraint(fields=("owner", "currency"), name="unique_balance_currency"),
+        ),
+        migrations.RunPython(split_balances_per_currency, migrations.RunPython.noop),
+    ]
@@ -16,6 +16,13 @@ CURRENCY_CHOICES = [
     ("TRY", "Turkish lira"),
 ]
 
+SETTLEMENT_STRATEGY_CHOICES = [
+    ("auto", "Automatic"),
+    ("exact", "Fewest debts"),
+    ("greedy", "Greedy"),
+    ("vectorized", "Greedy, vectorized"),
+]
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email=None, password=None, **extra_fields):
@@ -96,19 +103,33 @@ class Group(models.Model):
     description = models.TextField(null=True, blank=True)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     users = models.ManyToManyField(User, null=True, related_name="expense_groups")
+    # False when the debts simplification ran out of time and the debts were
+    # settled greedily, so they may not be the fewest possible
+    debts_optimal = models.BooleanField(default=True)
+    settlement_strategy = models.CharField(max_length=16, choices=SETTLEMENT_STRATEGY_CHOICES, default="auto")
+    # Incremented on every change of the group, its members, expenses,
+    # balances or debts, the ETag of its reads. The debts are up to date when
+    # they were computed for the current version.
+    version = models.PositiveBigIntegerField(default=0)
+    debts_version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f'Group("{self.title}")'
 
 
 class Balance(models.Model):
-    owner = models.OneToOneField(Member, blank=True, null=True, on_delete=models.CASCADE)
+    # The balance of a member in a currency, members only owing each other in
+    # the same currency
+    owner = models.ForeignKey(Member, blank=True, null=True, on_delete=models.CASCADE, related_name="balances")
     currency = models.CharField(max_length=4, choices=CURRENCY_CHOICES, default="EUR")
     group = models.ForeignKey(Group, on_delete=models.CASCADE, default=None)
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
 
     def __str__(self):
-        return f'Owner("{self.owner.name}"): {self.amount}'
+        return f'Owner("{self.owner.name}"): {self.amount} {self.currency}'
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["owner", "currency"], name="unique_balance_currency")]
 
 
 class Expense(models.Model):
@@ -141,6 +162,25 @@ class Expense(models.Model):
         return participants_str
 
 
+class ExpenseShare(models.Model):
+    # The ledger the balances are computed from: the cents a member paid and
+    # owes for an expense. Rows with no expense write off the debts of a member
+    # who left the group.
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, null=True, blank=True, related_name="shares")
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name="expense_shares")
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, default=None)
+    currency = models.CharField(max_length=4, choices=CURRENCY_CHOICES, default="EUR")
+    paid_cents = models.BigIntegerField(default=0)
+    owed_cents = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"ExpenseShare({self.member_id} in {self.expense_id}): paid {self.paid_cents}, owes {self.owed_cents}"
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["expense", "member"], name="unique_expense_share")]
+        indexes = [models.Index(fields=["group", "member"])]
+
+
 class Debt(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=4, choices=CURRENCY_CHOICES, default="EUR")
@@ -152,6 +192,15 @@ class Debt(models.Model):
         return f"Debt({self.borrower.name} to {self.lender.name}): {self.amount}"
 
 
+class DebtRecomputeJob(models.Model):
+    # A group whose debts are to be recomputed by the debt worker
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="debt_recompute_jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"DebtRecomputeJob(group {self.group_id})"
+
+
 class InviteToken(models.Model):
     token = models.CharField(max_length=64)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -183,3 +232,7 @@ class Activity(models.Model):
 
     def __str__(self):
         return f"Activity: {self.text}"
+
+    class Meta:
+        # The feed of a group, newest first
+        indexes = [models.Index(fields=["group", "-date", "-id"], name="activity_group_date_id_idx")]
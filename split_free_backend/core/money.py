@@ -0,0 +1,27 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount):
+    # Amounts are stored with 2 decimal places, let's work on the integer
+    # number of cents they stand for
+    return int(Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+def allocate_cents(cents, weights):
+    # Split `cents` into integer shares proportional to `weights`, summing up
+    # exactly to `cents`: every share is rounded down, and the cents left go
+    # to the largest remainders, the first weights winning ties
+    total_weight = sum(weights)
+    shares = [cents * weight // total_weight for weight in weights]
+    remainders = [cents * weight % total_weight for weight in weights]
+    for i in sorted(range(len(weights)), key=lambda i: -remainders[i])[: cents - sum(shares)]:
+        shares[i] += 1
+    return shares
@@ -0,0 +1,65 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class ActivityPagination(CursorPagination):
+    # Newest first. The cursor holds the (date, id) of the activity the page
+    # starts after, so each page is a range of the (group, date, id) index
+    # however old it is. DRF's cursor only holds the date and skips the
+    # activities sharing it with an offset.
+    ordering = ("-date", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        # The previous pages are read backwards, from the oldest activity
+        if reverse:
+            queryset = queryset.order_by("date", "id")
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            date, pk = self.decode_position(position)
+            lookup = "gt" if reverse else "lt"
+            queryset = queryset.filter(Q(**{f"date__{lookup}": date}) | Q(date=date, **{f"id__{lookup}": pk}))
+
+        # One more activity tells whether there is a page past this one
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        self.has_next = more if not reverse else bool(self.page)
+        self.has_previous = more if reverse else position is not None and bool(self.page)
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.encode_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.encode_position(self.page[0])))
+
+    def encode_position(self, activity):
+        return f"{activity.date.isoformat()}|{activity.pk}"
+
+    def decode_position(self, position):
+        date, _, pk = position.rpartition("|")
+        date = parse_datetime(date)
+        if date is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return date, int(pk)
@@ -0,0 +1,66 @@
+# Copyright (c) 2024 SplitFree Org.
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+encoder = JSONEncoder()
+
+
+def default(obj):
+    # The types orjson and msgpack do not serialize themselves, like the REST
+    # framework encoder does
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    # The same JSON as the REST framework renderer, encoded by orjson when
+    # installed. Floats written with an exponent are the exception, without the
+    # "+" and the leading zeros of the exponent, and NaN and infinite floats
+    # are written as null rather than rejected; the API has neither, amounts
+    # being strings.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            # Integers of more than 64 bits and the types that can't be
+            # serialized, which then fail the same way
+            return super().render(data, accepted_media_type, renderer_context)
+        # The line and paragraph separators are escaped for JavaScript
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return content
+
+
+class MessagePackRenderer(BaseRenderer):
+    # MessagePack for the mobile clients, the amounts being integer cents in
+    # that format
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=default)
@@ -0,0 +1,76 @@
+# Copyright (c) 2024 SplitFree Org.
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCacheStats:
+    # Number of responses served from the cache, rendered because they were not
+    # cached, stored, and evicted because their group changed, in this process
+    def __init__(self):
+        self.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+def get_response_cache():
+    alias = settings.RESPONSE_CACHE_BACKEND
+    return caches[alias] if alias else None
+
+
+def get_index_key(group_id):
+    # The keys of the responses cached for a group, to evict them
+    return f"response:{group_id}:keys"
+
+
+def get_response_key(group_id, version, request):
+    # The responses of a group are cached per version, those of the previous
+    # versions are never read again. The same URL is rendered in each format.
+    url = f"{request.build_absolute_uri()} {request.accepted_media_type}"
+    return f"response:{group_id}:{version}:{blake2b(url.encode(), digest_size=16).hexdigest()}"
+
+
+def get_cached_response(key):
+    # The content type and the content of the response, None if not cached
+    cached = get_response_cache().get(key)
+    if cached is None:
+        response_cache_stats.misses += 1
+    else:
+        response_cache_stats.hits += 1
+    return cached
+
+
+def cache_response(group_id, key, content_type, content):
+    cache = get_response_cache()
+    timeout = settings.RESPONSE_CACHE_TIMEOUT
+    cache.set(key, (content_type, content), timeout)
+    # The index is not updated atomically: the keys lost to a concurrent store
+    # are not evicted, only expire, their version being outdated anyway
+    index_key = get_index_key(group_id)
+    keys = cache.get(index_key, set())
+    keys.add(key)
+    cache.set(index_key, keys, timeout)
+    response_cache_stats.stores += 1
+
+
+def evict_responses(group_ids):
+    # Free the responses cached for the groups once they changed
+    cache = get_response_cache()
+    if cache is None:
+        return
+    indexes = cache.get_many([get_index_key(group_id) for group_id in set(group_ids)])
+    keys = [key for index in indexes.values() for key in index]
+    if indexes:
+        cache.delete_many(keys + list(indexes))
+    response_cache_stats.evictions += len(keys)
@@ -2,11 +2,13 @@
 # serializers.py
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import models
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from rest_framework import serializers
 
 from split_free_backend.core.models import (
+    CURRENCY_CHOICES,
     Activity,
     Balance,
     Debt,
@@ -16,6 +18,41 @@ from split_free_backend.core.models import (
     Member,
     User,
 )
+from split_free_backend.core.money import from_cents, to_cents
+from split_free_backend.core.parsers import MessagePackParser
+from split_free_backend.core.renderers import MessagePackRenderer
+
+
+def renders_cents(request):
+    # Whether the amounts of the response to the request are integer cents
+    accepted_renderer = getattr(request, "accepted_renderer", None)
+    return accepted_renderer is not None and accepted_renderer.format == MessagePackRenderer.format
+
+
+def parses_cents(request):
+    # Whether the amounts of the request data are integer cents
+    return request is not None and request.content_type.startswith(MessagePackParser.media_type)
+
+
+class AmountField(serializers.DecimalField):
+    # An amount of money, in integer cents for the clients using MessagePack
+    def to_representation(self, value):
+        if renders_cents(self.context.get("request")):
+            return to_cents(value)
+        return super().to_representation(value)
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool) and parses_cents(self.context.get("request")):
+            data = from_cents(data)
+        return super().to_internal_value(data)
+
+
+class AmountModelSerializer(serializers.ModelSerializer):
+    # The decimal fields of the models are amounts
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DecimalField: AmountField,
+    }
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -97,6 +134,7 @@ class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = "__all__"
+        read_only_fields = ["debts_optimal", "version", "debts_version"]
 
     def create(self, validated_data):
         user = self.context["request"].user
@@ -110,31 +148,60 @@ class GroupSerializer(serializers.ModelSerializer):
         group.users.add(user)
         return group
 
+    def update(self, instance, validated_data):
+        # Only the fields sent are saved, the versions and debts_optimal being
+        # updated concurrently with F() expressions
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(AmountModelSerializer):
     class Meta:
         model = Expense
         fields = "__all__"
 
 
+class ExpenseImportSerializer(serializers.Serializer):
+    # An expense of a bulk import. The group and members are given by id, the
+    # view checks them for the whole batch at once.
+    title = serializers.CharField(max_length=255)
+    amount = AmountField(max_digits=10, decimal_places=2)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    currency = serializers.ChoiceField(choices=CURRENCY_CHOICES, default="EUR")
+    date = serializers.CharField(max_length=240, required=False, allow_blank=True, default="")
+    group = serializers.IntegerField()
+    payer = serializers.IntegerField(required=False, allow_null=True, default=None)
+    participants = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+
 class ActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = "__all__"
 
 
-class DebtSerializer(serializers.ModelSerializer):
+class DebtSerializer(AmountModelSerializer):
     class Meta:
         model = Debt
         fields = "__all__"
 
 
-class BalanceSerializer(serializers.ModelSerializer):
+class BalanceSerializer(AmountModelSerializer):
     class Meta:
         model = Balance
         fields = "__all__"
 
 
+class MemberBalanceSerializer(MemberSerializer):
+    # A member along with their balances in the group, one per currency
+    balances = BalanceSerializer(many=True, read_only=True)
+
+    class Meta(MemberSerializer.Meta):
+        pass
+
+
 class InviteTokenSerializer(serializers.Serializer):
     group = serializers.CharField()
 
@@ -0,0 +1,513 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# Settlement engine: finds transfers settling the balances of a group, with no
+# dependency on Django so that it can be benchmarked and run anywhere.
+#
+# Internally balances are integer cents in an array, referred to by their
+# index in this array.
+
+import gc
+from array import array
+from collections import OrderedDict
+from hashlib import blake2b
+from heapq import heapify, heappop, heappush
+from math import isqrt
+from time import monotonic
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Past these numbers of states, the exact search would not fit in memory nor in
+# any reasonable time budget
+MAX_HALF_STATES = 1 << 18
+MAX_STATES = 1 << 22
+# Going through all the states takes at least this many seconds per state
+MIN_SECONDS_PER_STATE = 2e-7
+
+# Partitions of fewer balances are settled in process rather than on workers
+PARALLEL_MIN_BALANCES = 12
+
+
+class SettlementTimeout(Exception):
+    pass
+
+
+def check_deadline(deadline):
+    if deadline is not None and monotonic() > deadline:
+        raise SettlementTimeout()
+
+
+def check_number_of_states(number_of_states, deadline):
+    # Allocating the states alone may take longer than the time left
+    if number_of_states > MAX_STATES:
+        raise SettlementTimeout()
+    if deadline is not None and monotonic() + number_of_states * MIN_SECONDS_PER_STATE > deadline:
+        raise SettlementTimeout()
+
+
+def reduce_balances(cents):
+    # Members with a null balance are settled already, and two members whose
+    # balances cancel out exactly form a zero-sum group of their own: there is
+    # always an optimal settlement that keeps such a pair apart, so let's take
+    # these pairs out before the expensive search.
+    pairs = []
+    leftovers = {}
+    for index, amount in enumerate(cents):
+        if amount == 0:
+            continue
+        opposites = leftovers.get(-amount)
+        if opposites:
+            pairs.append(sorted([opposites.pop(), index], key=cents.__getitem__))
+        else:
+            leftovers.setdefault(amount, []).append(index)
+    remaining = [index for same_amount in leftovers.values() for index in same_amount]
+    return pairs, sorted(remaining, key=cents.__getitem__)
+
+
+def split_in_halves(counts):
+    # Spread the buckets of balances over two halves having about the same
+    # number of states, the biggest buckets first
+    halves = ([], [])
+    sizes = [1, 1]
+    for position in sorted(range(len(counts)), key=lambda position: -counts[position]):
+        half = 0 if sizes[0] <= sizes[1] else 1
+        halves[half].append(position)
+        sizes[half] *= counts[position] + 1
+    if max(sizes) > MAX_HALF_STATES:
+        raise SettlementTimeout()
+    return halves
+
+
+def get_half_states(amounts, counts, offsets, positions, deadline):
+    # List the (bitmask, sum) of every state of a half. Within a bucket, taking
+    # `digit` balances always means taking its `digit` lowest bits, so that
+    # including a state in another is a plain bitmask inclusion
+    states = [(0, 0)]
+    for position in positions:
+        check_deadline(deadline)
+        digits = [
+            ((((1 << digit) - 1) << offsets[position]), digit * amounts[position])
+            for digit in range(counts[position] + 1)
+        ]
+        expanded = []
+        for index, (mask, total) in enumerate(states):
+            if not index & 1023:
+                check_deadline(deadline)
+            expanded.extend((mask | digit_mask, total + digit_total) for digit_mask, digit_total in digits)
+        states = expanded
+    return states
+
+
+def get_zero_sum_states(amounts, counts, offsets, limit, deadline):
+    # Meet in the middle: a state sums to 0 when the sums of its two halves
+    # cancel out, so only the zero-sum states are ever built. Returns None when
+    # there are more than `limit` of them
+    half_a, half_b = split_in_halves(counts)
+    states_b = {}
+    for mask, total in get_half_states(amounts, counts, offsets, half_b, deadline):
+        states_b.setdefault(total, []).append(mask)
+
+    zero_sum_states = []
+    for index, (mask_a, total) in enumerate(get_half_states(amounts, counts, offsets, half_a, deadline)):
+        for mask_b in states_b.get(-total, ()):
+            zero_sum_states.append(mask_a | mask_b)
+        if len(zero_sum_states) > limit:
+            return None
+        if not index & 1023:
+            check_deadline(deadline)
+    return zero_sum_states
+
+
+def get_partition_from_zero_sum_states(zero_sum_states, full_state, deadline):
+    # A split in zero-sum selections is a chain of zero-sum states, each one
+    # including the previous one. Let's find the longest chain, the states being
+    # sorted so that a state comes after all the states it includes
+    zero_sum_states.sort(key=lambda mask: (mask.bit_count(), mask))
+    longest = [0] * len(zero_sum_states)
+    previous = [None] * len(zero_sum_states)
+    for index, mask in enumerate(zero_sum_states):
+        for other_index in range(index):
+            # The deadline is checked at each state and every few thousand
+            # inner iterations, the loop being quadratic
+            if not other_index & 4095:
+                check_deadline(deadline)
+            other_mask = zero_sum_states[other_index]
+            if other_mask & ~mask == 0 and longest[other_index] + 1 > longest[index]:
+                longest[index] = longest[other_index] + 1
+                previous[index] = other_index
+
+    # The full state is the last one when the balances sum up to 0, otherwise
+    # what is left over once the longest chain is settled is a selection too
+    index = max(range(len(zero_sum_states)), key=lambda index: longest[index])
+    partition = [full_state & ~zero_sum_states[index]] if zero_sum_states[index] != full_state else []
+    while previous[index] is not None:
+        partition.append(zero_sum_states[index] & ~zero_sum_states[previous[index]])
+        index = previous[index]
+    return partition
+
+
+def get_partition_from_all_states(amounts, counts, offsets, deadline):
+    # Dynamic programming over every state, encoded as a mixed-radix integer
+    # (a plain bitmask when all amounts are distinct). The subset sum of every
+    # state is memoized in `sums`, and best[state] is the maximum number of
+    # zero-sum selections the balances of `state` can be split into
+    strides = []
+    size = 1
+    for count in counts:
+        strides.append(size)
+        size *= count + 1
+    check_number_of_states(size, deadline)
+
+    sums = array("q", [0]) * size
+    best = array("I", [0]) * size
+    digits = [0] * len(counts)
+    for state in range(1, size):
+        if not state & 1023:
+            check_deadline(deadline)
+        # Move the digits to the current state like an odometer, the lowest
+        # digit that moved tells from which memoized sum to start
+        position = 0
+        while digits[position] == counts[position]:
+            digits[position] = 0
+            position += 1
+        digits[position] += 1
+        sums[state] = sums[state - strides[position]] + amounts[position]
+
+        best_previous = 0
+        for position, digit in enumerate(digits):
+            if digit and best[state - strides[position]] > best_previous:
+                best_previous = best[state - strides[position]]
+        best[state] = best_previous + (sums[state] == 0)
+
+    # Walk back from the full state, removing one balance at a time along an
+    # optimal path: every zero-sum state crossed closes a selection
+    partition = []
+    selection = 0
+    state = size - 1
+    digits = list(counts)
+    while state:
+        target = best[state] - (sums[state] == 0)
+        for position, digit in enumerate(digits):
+            if digit and best[state - strides[position]] == target:
+                break
+        digits[position] -= 1
+        state -= strides[position]
+        selection |= 1 << (offsets[position] + digits[position])
+        if sums[state] == 0:
+            partition.append(selection)
+            selection = 0
+    return partition
+
+
+def get_zero_sum_selections(cents, indices, deadline=None):
+    # Split the balances into the maximum number of selections that sum up to
+    # 0. A selection of k balances is settled with k - 1 debts, so maximising
+    # the number of selections minimises the number of debts.
+    #
+    # Balances with the same amount are interchangeable, so a state of the
+    # search is how many balances of each distinct amount it takes.
+    #
+    # Raises SettlementTimeout once `deadline` (on the monotonic clock) is
+    # passed.
+    check_deadline(deadline)
+    buckets = {}
+    for index in indices:
+        buckets.setdefault(cents[index], []).append(index)
+    amounts = list(buckets)
+    counts = [len(buckets[amount]) for amount in amounts]
+    if not amounts:
+        return []
+
+    # Each balance gets a bit, the balances of a same bucket being contiguous
+    offsets = []
+    number_of_balances = 0
+    for count in counts:
+        offsets.append(number_of_balances)
+        number_of_balances += count
+    full_state = (1 << number_of_balances) - 1
+
+    # Chaining the zero-sum states costs the square of their number, going
+    # through all the states costs their number times the number of buckets:
+    # let's take the cheapest, zero-sum states being usually scarce
+    number_of_states = 1
+    for count in counts:
+        number_of_states *= count + 1
+    zero_sum_states = get_zero_sum_states(
+        amounts, counts, offsets, limit=isqrt(min(number_of_states, MAX_STATES) * len(counts)), deadline=deadline
+    )
+    if zero_sum_states is None:
+        partition = get_partition_from_all_states(amounts, counts, offsets, deadline)
+    else:
+        partition = get_partition_from_zero_sum_states(zero_sum_states, full_state, deadline)
+
+    selections = []
+    for mask in partition:
+        selection = []
+        for amount, count, offset in zip(amounts, counts, offsets):
+            taken = ((mask >> offset) & ((1 << count) - 1)).bit_count()
+            selection.extend(buckets[amount][:taken])
+            buckets[amount] = buckets[amount][taken:]
+        selections.append(sorted(selection, key=cents.__getitem__))
+    return selections
+
+
+def get_transfers_from(selection, cents):
+    if len(selection) < 2:
+        return []
+    # As the balances in the selection are sorted according to their amount,
+    # let's consider the first and the last one, one will be positive and the
+    # other one negative. Let's make them match into a transfer so that the one
+    # with the smallest absolute value is removed and the one with the greatest
+    # absolute value is kept with what's left. In case they cancel out, they
+    # both disappear. Transfers are (borrower, lender, cents) triples.
+    selection = list(selection)
+    amounts = [cents[index] for index in selection]
+    transfers = []
+    while len(selection) > 1 and amounts[0] < 0 < amounts[-1]:
+        # The first element is negative and the last positive, we sum them to
+        # "get the difference" and judge which one has more "weight"
+        difference = amounts[0] + amounts[-1]
+        if difference < 0:
+            # Example amounts[0] -> -100 and amounts[-1] -> +10
+            transfers.append((selection[-1], selection[0], amounts[-1]))
+            amounts[0] = difference
+            selection.pop()
+            amounts.pop()
+        elif difference > 0:
+            # Example amounts[0] -> -10 and amounts[-1] -> +100
+            transfers.append((selection[-1], selection[0], -amounts[0]))
+            amounts[-1] = difference
+            selection.pop(0)
+            amounts.pop(0)
+        else:
+            # Example amounts[0] -> -100 and amounts[-1] -> +100
+            transfers.append((selection[-1], selection[0], amounts[-1]))
+            del selection[0], selection[-1]
+            del amounts[0], amounts[-1]
+    return transfers
+
+
+def get_greedy_transfers(cents, indices):
+    # Match the largest borrower with the largest lender until one of them is
+    # settled, at most (len(indices) - 1) transfers but not always the fewest
+    borrowers = [(-cents[index], index) for index in indices if cents[index] > 0]
+    lenders = [(cents[index], index) for index in indices if cents[index] < 0]
+    heapify(borrowers)
+    heapify(lenders)
+    transfers = []
+    while borrowers and lenders:
+        borrowed, borrower = heappop(borrowers)
+        lent, lender = heappop(lenders)
+        amount = min(-borrowed, -lent)
+        transfers.append((borrower, lender, amount))
+        if -borrowed > amount:
+            heappush(borrowers, (borrowed + amount, borrower))
+        if -lent > amount:
+            heappush(lenders, (lent + amount, lender))
+    return transfers
+
+
+def get_vectorized_transfers(cents):
+    # Line up the borrowers and the lenders, both from the largest amount, and
+    # cut their cumulative amounts wherever one of them is settled: each piece
+    # is a transfer, at most (len(cents) - 1) of them in O(N log N)
+    amounts = numpy.frombuffer(cents, dtype=numpy.int64)
+    borrowers = numpy.flatnonzero(amounts > 0)
+    lenders = numpy.flatnonzero(amounts < 0)
+    if not len(borrowers) or not len(lenders):
+        return []
+    borrowers = borrowers[numpy.argsort(-amounts[borrowers], kind="stable")]
+    lenders = lenders[numpy.argsort(amounts[lenders], kind="stable")]
+    borrowed = numpy.cumsum(amounts[borrowers])
+    lent = numpy.cumsum(-amounts[lenders])
+
+    cuts = numpy.union1d(borrowed, lent)
+    cuts = cuts[cuts <= min(borrowed[-1], lent[-1])]
+    starts = numpy.concatenate(([0], cuts[:-1]))
+    return list(
+        zip(
+            borrowers[numpy.searchsorted(borrowed, starts, side="right")].tolist(),
+            lenders[numpy.searchsorted(lent, starts, side="right")].tolist(),
+            (cuts - starts).tolist(),
+        )
+    )
+
+
+class Transfer:
+    __slots__ = ("borrower", "lender", "cents")
+
+    def __init__(self, borrower, lender, cents):
+        self.borrower = borrower
+        self.lender = lender
+        self.cents = cents
+
+    def __eq__(self, other):
+        return isinstance(other, Transfer) and (self.borrower, self.lender, self.cents) == (
+            other.borrower,
+            other.lender,
+            other.cents,
+        )
+
+    def __repr__(self):
+        return f"Transfer({self.borrower} to {self.lender}): {self.cents}"
+
+
+class Settlement:
+    __slots__ = ("transfers", "optimal")
+
+    def __init__(self, transfers, optimal):
+        self.transfers = transfers
+        self.optimal = optimal
+
+
+class SettlementCache:
+    # Least recently used settlements, keyed by a fingerprint of the sorted
+    # balances so that groups with the same balances share their settlement.
+    # A settlement is stored as a template: the transfers refer to positions in
+    # the sorted balances, and get bound to the member ids of each group.
+    #
+    # `backend` is an optional cache shared between processes, with get and set
+    # methods like a Django cache.
+
+    def __init__(self, maxsize=1024, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.templates = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def fingerprint(strategy, sorted_cents):
+        return f"settlement:{strategy}:{blake2b(sorted_cents.tobytes(), digest_size=16).hexdigest()}"
+
+    def remember(self, key, template):
+        self.templates[key] = template
+        self.templates.move_to_end(key)
+        while len(self.templates) > self.maxsize:
+            self.templates.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        template = self.templates.get(key)
+        if template is None and self.backend is not None:
+            template = self.backend.get(key)
+        if template is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, template)
+        return template
+
+    def set(self, key, template):
+        self.remember(key, template)
+        if self.backend is not None:
+            self.backend.set(key, template)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.templates)}
+
+
+def settle_exactly(cents, deadline):
+    # Returns the transfers settling the balances and whether they are the
+    # fewest possible. Once `deadline` is passed, the exact search gives up:
+    # the pairs found so far are kept and the greedy matcher settles the
+    # remaining balances.
+    pairs, remaining = reduce_balances(cents)
+    # The search allocates states by the hundreds of thousands, none of them
+    # in a reference cycle: a full collection of a large process in the middle
+    # would overrun the deadline by as long
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        selections = pairs + get_zero_sum_selections(cents, remaining, deadline)
+        optimal = True
+    except SettlementTimeout:
+        selections = pairs
+        optimal = False
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    # Extract the transfers from the selections. As none of their
+    # sub-selections can sum to 0, we get (selection-length - 1) transfers out
+    # of each selection
+    transfers = []
+    for selection in selections:
+        transfers.extend(get_transfers_from(selection, cents))
+    if not optimal:
+        transfers.extend(get_greedy_transfers(cents, remaining))
+    return transfers, optimal
+
+
+def settle_greedily(cents, deadline):
+    return get_greedy_transfers(cents, range(len(cents))), False
+
+
+def settle_vectorized(cents, deadline):
+    return get_vectorized_transfers(cents), False
+
+
+STRATEGIES = {
+    "exact": settle_exactly,
+    "greedy": settle_greedily,
+}
+# The vectorized greedy strategy needs the optional NumPy
+if numpy is not None:
+    STRATEGIES["vectorized"] = settle_vectorized
+
+
+def solve(strategy, cents, deadline):
+    return STRATEGIES[strategy](cents, deadline)
+
+
+def settle_partitions(partitions, strategy="exact", time_budget=None, cache=None, executor=None):
+    # Settle independent partitions of balances, like the balances of each
+    # currency of a group: `partitions` maps a key to a sequence of
+    # (member_id, cents). The partitions share the time budget and, given an
+    # `executor`, are solved concurrently on its workers. Returns a dict of
+    # Settlement with the keys of `partitions`.
+    deadline = None if time_budget is None else monotonic() + time_budget
+    prepared = {}
+    templates = {}
+    for key, balances in partitions.items():
+        # Sorting the balances gives the same cents and positions to groups
+        # having the same balances, whatever their members
+        balances = sorted(balances, key=lambda balance: balance[1])
+        cents = array("q", (amount for _, amount in balances))
+        fingerprint = cache.fingerprint(strategy, cents) if cache is not None else None
+        prepared[key] = ([member_id for member_id, _ in balances], cents, fingerprint)
+        templates[key] = cache.get(fingerprint) if cache is not None else None
+
+    # Small partitions are not worth the round trip to a worker
+    missing = [key for key in partitions if templates[key] is None]
+    parallel = [key for key in missing if len(prepared[key][1]) >= PARALLEL_MIN_BALANCES]
+    futures = {}
+    if executor is not None and len(parallel) > 1:
+        futures = {key: executor.submit(solve, strategy, prepared[key][1], deadline) for key in parallel}
+    for key in missing:
+        if key not in futures:
+            templates[key] = solve(strategy, prepared[key][1], deadline)
+    for key, future in futures.items():
+        templates[key] = future.result()
+
+    settlements = {}
+    for key, (member_ids, _, fingerprint) in prepared.items():
+        transfers, optimal = templates[key]
+        # The exact search may do better next time it is not cut short
+        if cache is not None and key in missing and (optimal or strategy != "exact"):
+            cache.set(fingerprint, templates[key])
+        settlements[key] = Settlement(
+            [Transfer(member_ids[borrower], member_ids[lender], amount) for borrower, lender, amount in transfers],
+            optimal,
+        )
+    return settlements
+
+
+def settle(balances, strategy="exact", time_budget=None, cache=None):
+    # Settle `balances`, a sequence of (member_id, cents), with one of the
+    # STRATEGIES within `time_budget` seconds (None for no limit), reusing the
+    # settlements of the same balances found in the optional SettlementCache
+    return settle_partitions({None: balances}, strategy=strategy, time_budget=time_budget, cache=cache)[None]
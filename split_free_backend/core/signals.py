@@ -1,13 +1,28 @@
 # Copyright (c) 2023 SplitFree Org.
 
-from decimal import Decimal
-
 from django.db.models.signals import Signal
 from django.dispatch import receiver
 from django.forms.models import model_to_dict
 
-from split_free_backend.core.algo_debts import calculate_new_debts
-from split_free_backend.core.models import Balance, Debt, Expense, Member
+from split_free_backend.core.ledger import get_expense_shares
+from split_free_backend.core.locking import lock_groups
+from split_free_backend.core.models import (
+    Balance,
+    Debt,
+    Expense,
+    ExpenseShare,
+    Group,
+    Member,
+)
+from split_free_backend.core.money import to_cents
+from split_free_backend.core.response_cache import evict_responses
+from split_free_backend.core.unit_of_work import (
+    bump_versions,
+    defer_balances_refresh,
+    defer_debts_recompute,
+    flush_pending,
+)
+from split_free_backend.core.utils.misc import apply_on_commit
 
 ################################################################################
 # Group
@@ -37,6 +52,9 @@ group_updated = Signal()
 
 @receiver(group_updated)
 def handle_group_updated(sender, instance, old_member_names, new_member_names, **kwargs):
+    lock_groups([instance.pk])
+    bump_versions([instance.pk])
+
     # Handle the case: members are added to the group
     added_member_names = set(new_member_names) - set(old_member_names)
     if added_member_names:
@@ -48,28 +66,38 @@ def handle_group_updated(sender, instance, old_member_names, new_member_names, *
     # Handle the case: members are removed from the group
     removed_member_names = set(old_member_names) - set(new_member_names)
     if removed_member_names:
-        removed_members = Member.objects.filter(name__in=removed_member_names, group=instance)
-        # Update impacted expenses of the group
-        expenses_to_update = Expense.objects.filter(group=instance, participants__in=removed_members).distinct()
-        for expense_to_update in expenses_to_update:
-            old_expense_info = model_to_dict(expense_to_update)
-            # If the payer is withing the removed members, it means he withdrew
-            # Therefore, the other expense participants won't have to pay him
-            # back. We set the expense payer to None, and this logic will be
-            # handled in apply_impact_expense
-            if expense_to_update.payer in removed_members:
-                expense_to_update.payer = None
-            # Remove the removed members from the expense participants
-            for removed_member in removed_members:
-                if removed_member in expense_to_update.participants.all():
-                    expense_to_update.participants.remove(removed_member)
-            new_expense_info = model_to_dict(expense_to_update)
-            undo_impact_expense(expense_info=old_expense_info)
-            apply_impact_expense(expense_info=new_expense_info)
-        # Remove the members, the balances will be removed by the on_delete
-        removed_members.delete()
-
-        calculate_new_debts(group=instance)
+        remove_members(instance, Member.objects.filter(name__in=removed_member_names, group=instance))
+
+
+def remove_members(group, removed_members):
+    # Remove the members from the expenses of the group and split these
+    # expenses again among the other participants, with the same number of
+    # queries whatever the number of expenses
+    removed_member_ids = list(removed_members.values_list("pk", flat=True))
+    Participant = Expense.participants.through
+    impacted_expense_ids = set(
+        Participant.objects.filter(member_id__in=removed_member_ids).values_list("expense_id", flat=True)
+    )
+    # If the payer is within the removed members, it means they withdrew.
+    # Therefore, the other expense participants won't have to pay them back.
+    paid_expenses = Expense.objects.filter(group=group, payer_id__in=removed_member_ids)
+    impacted_expense_ids.update(paid_expenses.values_list("pk", flat=True))
+    paid_expenses.update(payer=None)
+    Participant.objects.filter(member_id__in=removed_member_ids).delete()
+
+    # Rebuild the ledger rows of the impacted expenses
+    ExpenseShare.objects.filter(expense_id__in=impacted_expense_ids).delete()
+    expenses = Expense.objects.filter(pk__in=impacted_expense_ids).prefetch_related("participants")
+    ExpenseShare.objects.bulk_create(
+        [share for expense in expenses for share in get_expense_shares(model_to_dict(expense))],
+        batch_size=1000,
+    )
+
+    # Remove the members, the balances will be removed by the on_delete
+    Member.objects.filter(pk__in=removed_member_ids).delete()
+
+    defer_balances_refresh([group.pk])
+    defer_debts_recompute([group.pk])
 
 
 ################################################################################
@@ -77,37 +105,20 @@ def handle_group_updated(sender, instance, old_member_names, new_member_names, *
 
 
 def apply_impact_expense(expense_info):
-    # In case the payer paid and left, it's free for the other members of the
-    # expense
-    if not expense_info["payer"]:
-        return
-
-    payer_balance = Balance.objects.get(group=expense_info["group"], owner=expense_info["payer"])
-    payer_balance.amount -= expense_info["amount"]
-    payer_balance.save()
-
-    # This is the amount that each participant needs to pay for the expense
-    split_amount = Decimal(float(expense_info["amount"]) / len(expense_info["participants"]))
-
-    for member in expense_info["participants"]:
-        member_balance = Balance.objects.get(group=expense_info["group"], owner=member)
-        member_balance.amount += split_amount
-        member_balance.save()
+    ExpenseShare.objects.bulk_create(get_expense_shares(expense_info))
+    defer_balances_refresh([expense_info["group"]])
 
 
 def undo_impact_expense(expense_info):
-    if expense_info["payer"] and expense_info["participants"]:
-        payer_balance = Balance.objects.get(group=expense_info["group"], owner=expense_info["payer"])
-        payer_balance.amount += expense_info["amount"]
-        payer_balance.save()
+    ExpenseShare.objects.filter(expense_id=expense_info["id"]).delete()
+    defer_balances_refresh([expense_info["group"]])
 
-        # This is the amount that each participant paid for the expense
-        split_amount = Decimal(float(expense_info["amount"]) / len(expense_info["participants"]))
 
-        for member in expense_info["participants"]:
-            member_balance = Balance.objects.get(group=expense_info["group"], owner=member)
-            member_balance.amount -= split_amount
-            member_balance.save()
+def renew_impact_expense(old_expense_info, new_expense_info):
+    # Replace the ledger rows of the expense at once
+    ExpenseShare.objects.filter(expense_id=old_expense_info["id"]).delete()
+    ExpenseShare.objects.bulk_create(get_expense_shares(new_expense_info))
+    defer_balances_refresh({old_expense_info["group"], new_expense_info["group"]})
 
 
 expense_created = Signal()
@@ -115,8 +126,9 @@ expense_created = Signal()
 
 @receiver(expense_created)
 def handle_expense_created(sender, instance, **kwargs):
+    lock_groups([instance.group_id])
     apply_impact_expense(expense_info=model_to_dict(instance))
-    calculate_new_debts(group=instance.group)
+    defer_debts_recompute([instance.group_id])
 
 
 expense_updated = Signal()
@@ -124,9 +136,9 @@ expense_updated = Signal()
 
 @receiver(expense_updated)
 def renew_debts_and_transfers(sender, instance, old_expense_info, new_expense_info, **kwargs):
-    undo_impact_expense(expense_info=old_expense_info)
-    apply_impact_expense(expense_info=new_expense_info)
-    calculate_new_debts(group=instance.group)
+    lock_groups([old_expense_info["group"], new_expense_info["group"]])
+    renew_impact_expense(old_expense_info=old_expense_info, new_expense_info=new_expense_info)
+    defer_debts_recompute({old_expense_info["group"], new_expense_info["group"]})
 
 
 ################################################################################
@@ -134,15 +146,31 @@ def renew_debts_and_transfers(sender, instance, old_expense_info, new_expense_in
 
 
 def undo_impact_member(member):
-    Balance.objects.get(owner=member).delete()
-
-    for debt in Debt.objects.filter(borrower=member):
-        debt.lender.balance.amount += debt.amount
-        debt.lender.balance.save()
-
-    for debt in Debt.objects.filter(lender=member):
-        debt.borrower.balance.amount -= debt.amount
-        debt.borrower.balance.save()
+    # The debts of the member must be up to date to write them off
+    flush_pending([member.group_id])
+    Balance.objects.filter(owner=member).delete()
+
+    # The member leaves with their debts written off: the members they owed
+    # won't get paid back, and the members owing them don't owe anything
+    # anymore
+    write_offs = [
+        ExpenseShare(
+            member_id=debt.lender_id, group_id=debt.group_id, currency=debt.currency, owed_cents=to_cents(debt.amount)
+        )
+        for debt in Debt.objects.filter(borrower=member)
+    ]
+    write_offs.extend(
+        ExpenseShare(
+            member_id=debt.borrower_id,
+            group_id=debt.group_id,
+            currency=debt.currency,
+            paid_cents=to_cents(debt.amount),
+        )
+        for debt in Debt.objects.filter(lender=member)
+    )
+    ExpenseShare.objects.filter(member=member).delete()
+    ExpenseShare.objects.bulk_create(write_offs)
+    defer_balances_refresh([member.group_id])
 
 
 expense_destroyed = Signal()
@@ -150,12 +178,29 @@ member_deleted = Signal()
 
 
 def remove_debts_and_transfers(sender, instance, **kwargs):
+    lock_groups([instance.group_id])
     if isinstance(instance, Expense):
         undo_impact_expense(expense_info=model_to_dict(instance))
     elif isinstance(instance, Member):
         undo_impact_member(member=instance)
-    calculate_new_debts(group=instance.group)
+    defer_debts_recompute([instance.group_id])
 
 
 expense_destroyed.connect(remove_debts_and_transfers)
 member_deleted.connect(remove_debts_and_transfers)
+
+
+################################################################################
+# Response cache
+
+
+@receiver([group_updated, expense_created, expense_destroyed, member_deleted])
+def evict_group_responses(sender, instance, **kwargs):
+    group_id = instance.pk if isinstance(instance, Group) else instance.group_id
+    apply_on_commit(lambda: evict_responses([group_id]))
+
+
+@receiver(expense_updated)
+def evict_expense_responses(sender, instance, old_expense_info, new_expense_info, **kwargs):
+    group_ids = {old_expense_info["group"], new_expense_info["group"]}
+    apply_on_commit(lambda: evict_responses(group_ids))
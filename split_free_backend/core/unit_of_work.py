@@ -0,0 +1,144 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# A request can impact the same group several times, e.g. when it removes
+# members involved in several expenses. Within a unit of work the refresh of
+# the balances and the recompute of the debts of a group are deferred, and
+# done once per group when the unit of work ends.
+
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveBigIntegerField, When
+
+from split_free_backend.core.algo_debts import calculate_new_debts
+from split_free_backend.core.debt_queue import enqueue_debts_recompute
+from split_free_backend.core.ledger import refresh_balances
+from split_free_backend.core.locking import lock_groups
+from split_free_backend.core.models import Group
+from split_free_backend.core.utils.misc import apply_on_commit
+
+_local = Local()
+
+
+class UnitOfWork:
+    def __init__(self):
+        self.balance_group_ids = set()
+        self.debt_group_ids = set()
+        # The groups whose version was bumped
+        self.versioned_group_ids = set()
+
+    def discard(self):
+        self.balance_group_ids.clear()
+        self.debt_group_ids.clear()
+        self.versioned_group_ids.clear()
+
+    def flush(self, group_ids=None, synchronous=False, committed=False):
+        # Refresh the balances and then recompute the debts of the dirty
+        # groups, or only of `group_ids` when given. Once the changes are
+        # `committed`, their clients may have seen the version of the groups
+        # already: the refreshed balances get a new one.
+        balance_group_ids = self.balance_group_ids if group_ids is None else self.balance_group_ids & set(group_ids)
+        debt_group_ids = self.debt_group_ids if group_ids is None else self.debt_group_ids & set(group_ids)
+        self.balance_group_ids = self.balance_group_ids - balance_group_ids
+        self.debt_group_ids = self.debt_group_ids - debt_group_ids
+        if not balance_group_ids and not debt_group_ids:
+            return
+
+        with transaction.atomic():
+            lock_groups(balance_group_ids | debt_group_ids)
+            if balance_group_ids:
+                refresh_balances(sorted(balance_group_ids))
+                if committed:
+                    Group.objects.filter(pk__in=balance_group_ids).update(version=F("version") + 1)
+            if debt_group_ids:
+                recompute_debts(debt_group_ids, synchronous)
+
+
+def get_unit_of_work():
+    # The unit of work in progress, None if there is none
+    return getattr(_local, "unit_of_work", None)
+
+
+@contextmanager
+def unit_of_work():
+    # Defer the refresh of the balances and the recompute of the debts to the
+    # end of the block, or after the commit of the transaction with
+    # USE_ON_COMMIT_HOOK. Nested blocks join the outermost one. Nothing is
+    # done if the block raises an exception or calls `discard`.
+    work = get_unit_of_work()
+    if work is not None:
+        yield work
+        return
+
+    work = _local.unit_of_work = UnitOfWork()
+    try:
+        yield work
+    finally:
+        _local.unit_of_work = None
+    apply_on_commit(lambda: work.flush(committed=settings.USE_ON_COMMIT_HOOK))
+
+
+def defer_balances_refresh(group_ids):
+    work = get_unit_of_work()
+    if work is None:
+        refresh_balances(list(group_ids))
+    else:
+        work.balance_group_ids.update(group_ids)
+
+
+def recompute_debts(group_ids, synchronous=False):
+    # Recompute the debts of the groups, or leave it to the debt worker with
+    # DEBTS_RECOMPUTE_ASYNC
+    if settings.DEBTS_RECOMPUTE_ASYNC and not synchronous:
+        enqueue_debts_recompute(group_ids)
+        return
+    for group in Group.objects.filter(pk__in=group_ids).order_by("pk"):
+        calculate_new_debts(group=group)
+
+
+def defer_debts_recompute(group_ids):
+    # The balances of the groups changed: their debts are out of date until
+    # recomputed for their new version
+    work = get_unit_of_work()
+    group_ids = set(group_ids) - (work.debt_group_ids if work else set())
+    if not group_ids:
+        return
+    Group.objects.filter(pk__in=group_ids).update(version=F("version") + 1)
+    if work is None:
+        recompute_debts(group_ids)
+    else:
+        work.debt_group_ids.update(group_ids)
+        work.versioned_group_ids.update(group_ids)
+
+
+def bump_versions(group_ids):
+    # Anything else of the groups changed: a new version lets their clients
+    # know, the debts staying up to date if they were. Once per unit of work,
+    # the changes of a request being committed at once.
+    work = get_unit_of_work()
+    group_ids = set(group_ids) - (work.versioned_group_ids if work else set())
+    if not group_ids:
+        return
+    Group.objects.filter(pk__in=group_ids).update(
+        version=F("version") + 1,
+        debts_version=Case(
+            When(debts_version=F("version"), then=F("version") + 1),
+            default=F("debts_version"),
+            output_field=PositiveBigIntegerField(),
+        ),
+    )
+    if work is not None:
+        work.versioned_group_ids.update(group_ids)
+
+
+def flush_pending(group_ids):
+    # Bring the balances and debts of the groups up to date right away, for the
+    # code reading them
+    work = get_unit_of_work()
+    if work is not None:
+        work.flush(group_ids, synchronous=True)
+    # The debts may also be waiting for the debt worker
+    for group in Group.objects.filter(pk__in=group_ids).exclude(debts_version=F("version")):
+        calculate_new_debts(group=group)
@@ -10,9 +10,11 @@ from split_free_backend.core.views import (
     BalanceView,
     DebtView,
     EmailActivateView,
+    ExpenseBulkView,
     ExpenseDetailView,
     ExpenseView,
     GroupDetailView,
+    GroupSummaryView,
     GroupView,
     InviteGenerateView,
     LogoutView,
@@ -31,7 +33,9 @@ urlpatterns = [
     path("members/<int:pk>/", MemberDetailView.as_view(), name="member-detail"),
     path("groups/", GroupView.as_view(), name="group-list"),
     path("groups/<int:pk>/", GroupDetailView.as_view(), name="group-detail"),
+    path("groups/<int:pk>/summary/", GroupSummaryView.as_view(), name="group-summary"),
     path("expenses/", ExpenseView.as_view(), name="expense-list"),
+    path("expenses/bulk/", ExpenseBulkView.as_view(), name="expense-bulk"),
     path("expenses/<int:pk>/", ExpenseDetailView.as_view(), name="expense-detail"),
     # Token authentication
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
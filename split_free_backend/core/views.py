@@ -1,35 +1,57 @@
 # Copyright (c) 2023 SplitFree Org.
 from datetime import timedelta
 
+from django.conf import settings
+from django.db.models import Prefetch
 from django.forms.models import model_to_dict
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 from rest_framework import generics, status
 from rest_framework.decorators import permission_classes
 from rest_framework.permissions import BasePermission, IsAuthenticated
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from split_free_backend.core.fast_serializers import get_values_serializer
+from split_free_backend.core.ledger import get_expense_shares
+from split_free_backend.core.locking import lock_groups
 from split_free_backend.core.models import (
     Activity,
     Balance,
     Debt,
     Expense,
+    ExpenseShare,
     Group,
     InviteToken,
     Member,
     User,
 )
+from split_free_backend.core.pagination import ActivityPagination
+from split_free_backend.core.parsers import CSVParser
+from split_free_backend.core.response_cache import (
+    cache_response,
+    evict_responses,
+    get_cached_response,
+    get_response_cache,
+    get_response_key,
+)
 from split_free_backend.core.serializers import (
     ActivitySerializer,
     BalanceSerializer,
     DebtSerializer,
+    ExpenseImportSerializer,
     ExpenseSerializer,
     GroupSerializer,
     InviteTokenSerializer,
+    MemberBalanceSerializer,
     MemberSerializer,
     UserSerializer,
+    renders_cents,
 )
 from split_free_backend.core.signals import (
     expense_created,
@@ -39,6 +61,104 @@ from split_free_backend.core.signals import (
     group_updated,
     member_deleted,
 )
+from split_free_backend.core.unit_of_work import (
+    bump_versions,
+    defer_balances_refresh,
+    defer_debts_recompute,
+    unit_of_work,
+)
+from split_free_backend.core.utils.misc import apply_on_commit
+
+################################################################################
+# Unit of work
+
+
+class UnitOfWorkMixin:
+    # Refresh the balances and recompute the debts of the groups impacted by
+    # the request once, when the view is done with them
+    def dispatch(self, request, *args, **kwargs):
+        with unit_of_work() as work:
+            response = super().dispatch(request, *args, **kwargs)
+            # The transaction of the request is rolled back
+            if getattr(response, "exception", False):
+                work.discard()
+        return response
+
+
+################################################################################
+# Fast listing
+
+
+class ValuesListMixin:
+    # Serialize the listed rows from their columns rather than from model
+    # instances, the pages of the paginated lists being left to the serializer
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        values_serializer = get_values_serializer(self.get_serializer_class(), renders_cents(request))
+        return Response(values_serializer.serialize(queryset))
+
+
+################################################################################
+# Group versions
+
+
+class GroupETagMixin:
+    # The reads of the data of a group carry its version as a strong ETag, and
+    # the clients which already have that version get a 304 Not Modified after
+    # a lookup of the version. The other clients get the response cached for
+    # that version when RESPONSE_CACHE_BACKEND is set.
+    response_cache_formats = ("json", "msgpack")
+    response_cache_key = None
+
+    def get_etag_group_id(self):
+        return self.request.query_params.get("group_id")
+
+    def get(self, request, *args, **kwargs):
+        group_id = str(self.get_etag_group_id() or "")
+        version = None
+        if group_id.isdigit():
+            version = Group.objects.filter(pk=group_id, users=request.user).values_list("version", flat=True).first()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        # The same version is rendered differently in each format
+        etag = f'"{group_id}-{version}-{request.accepted_renderer.format}"'
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = self.get_cached_response(request, group_id, version) or super().get(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = etag
+            patch_vary_headers(response, ["Accept"])
+        return response
+
+    def get_cached_response(self, request, group_id, version):
+        # The user is a member of the group once its version is found. The
+        # browsable API is rendered for each user, and isn't cached.
+        if get_response_cache() is None or request.accepted_renderer.format not in self.response_cache_formats:
+            return None
+        self.response_cache_key = (group_id, get_response_key(group_id, version, request))
+        cached = get_cached_response(self.response_cache_key[1])
+        if cached is None:
+            return None
+        content_type, content = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.response_cache_key and isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            response.render()
+            cache_response(*self.response_cache_key, response["Content-Type"], response.content)
+        return response
+
+
+class GroupPathETagMixin(GroupETagMixin):
+    def get_etag_group_id(self):
+        return self.kwargs["pk"]
+
 
 ################################################################################
 # CustomPermission
@@ -115,7 +235,7 @@ class UserInfoView(APIView):
 # Member
 
 
-class MemberView(generics.ListCreateAPIView):
+class MemberView(GroupETagMixin, ValuesListMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = MemberSerializer
 
@@ -132,6 +252,8 @@ class MemberView(generics.ListCreateAPIView):
         serializer.save()
 
         Balance.objects.create(owner=serializer.instance, group=serializer.instance.group, amount=0.00)
+        bump_versions([serializer.instance.group_id])
+        apply_on_commit(lambda: evict_responses([serializer.instance.group_id]))
 
         Activity.objects.create(
             user=self.request.user,
@@ -141,13 +263,20 @@ class MemberView(generics.ListCreateAPIView):
         )
 
 
-class MemberDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MemberDetailView(UnitOfWorkMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = MemberSerializer
 
     def get_queryset(self):
         return Member.objects.filter(group__users=self.request.user)
 
+    def perform_update(self, serializer):
+        old_group_id = serializer.instance.group_id
+        serializer.save()
+        group_ids = {old_group_id, serializer.instance.group_id}
+        bump_versions(group_ids)
+        apply_on_commit(lambda: evict_responses(group_ids))
+
     def perform_destroy(self, instance):
         # Trigger the custom signal
         member_deleted.send(
@@ -168,12 +297,12 @@ class MemberDetailView(generics.RetrieveUpdateDestroyAPIView):
 # Group
 
 
-class GroupView(generics.ListCreateAPIView):
+class GroupView(UnitOfWorkMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = GroupSerializer
 
     def get_queryset(self):
-        return Group.objects.filter(users=self.request.user)
+        return Group.objects.filter(users=self.request.user).prefetch_related("users")
 
     def perform_create(self, serializer):
         serializer.save()
@@ -201,7 +330,7 @@ class GroupView(generics.ListCreateAPIView):
             )
 
 
-class GroupDetailView(generics.RetrieveUpdateDestroyAPIView):
+class GroupDetailView(UnitOfWorkMixin, GroupPathETagMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = GroupSerializer
 
@@ -243,6 +372,41 @@ class GroupDetailView(generics.RetrieveUpdateDestroyAPIView):
             old_member_names=old_member_names,
             new_member_names=new_member_names,
         )
+        # The response carries the new version
+        serializer.instance.refresh_from_db(fields=["version", "debts_version", "debts_optimal"])
+
+
+class GroupSummaryView(GroupPathETagMixin, generics.RetrieveAPIView):
+    # Everything shown when opening a group: the group, its members with their
+    # balances, its debts and its latest expenses, in a fixed number of queries
+    permission_classes = (IsAuthenticated,)
+    default_expenses = 20
+    max_expenses = 100
+
+    def retrieve(self, request, pk):
+        group = get_object_or_404(Group.objects.filter(users=request.user).prefetch_related("users"), pk=pk)
+        try:
+            number_of_expenses = int(request.query_params.get("expenses", self.default_expenses))
+        except ValueError:
+            return Response({"detail": "expenses must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        number_of_expenses = max(0, min(number_of_expenses, self.max_expenses))
+
+        members = (
+            Member.objects.filter(group=group)
+            .prefetch_related(Prefetch("balances", queryset=Balance.objects.order_by("currency")))
+            .order_by("id")
+        )
+        debts = Debt.objects.filter(group=group).order_by("id")
+        expenses = Expense.objects.filter(group=group).prefetch_related("participants").order_by("-id")
+        context = {"request": request}
+        return Response(
+            {
+                "group": GroupSerializer(group, context=context).data,
+                "members": MemberBalanceSerializer(members, many=True, context=context).data,
+                "debts": DebtSerializer(debts, many=True, context=context).data,
+                "expenses": ExpenseSerializer(expenses[:number_of_expenses], many=True, context=context).data,
+            }
+        )
 
 
 ################################################################################
@@ -254,7 +418,10 @@ class BaseExpenseView(generics.GenericAPIView):
     serializer_class = ExpenseSerializer
 
     def get_queryset(self):
-        user_expenses = Expense.objects.filter(group__users=self.request.user)
+        # The participants in the order of their ids, like the fast listing
+        user_expenses = Expense.objects.filter(group__users=self.request.user).prefetch_related(
+            Prefetch("participants", queryset=Member.objects.order_by("id"))
+        )
         group_id = self.request.query_params.get("group_id")
 
         if group_id:
@@ -264,7 +431,7 @@ class BaseExpenseView(generics.GenericAPIView):
         return user_expenses
 
 
-class ExpenseView(generics.ListCreateAPIView, BaseExpenseView):
+class ExpenseView(UnitOfWorkMixin, GroupETagMixin, ValuesListMixin, generics.ListCreateAPIView, BaseExpenseView):
     def perform_create(self, serializer):
         serializer.save()
 
@@ -280,7 +447,129 @@ class ExpenseView(generics.ListCreateAPIView, BaseExpenseView):
         )
 
 
-class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView, BaseExpenseView):
+class ExpenseBulkView(UnitOfWorkMixin, APIView):
+    # Import many expenses at once, from a JSON list or a CSV file with a
+    # header row, the participants of an expense being separated by ";" in CSV.
+    # The balances and debts of each group are updated once.
+    permission_classes = (IsAuthenticated,)
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, CSVParser]
+    max_expenses = 5000
+
+    def post(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get("expenses")
+        if not isinstance(rows, list) or not rows:
+            return Response({"detail": "Expected a list of expenses."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.max_expenses:
+            return Response(
+                {"detail": f"At most {self.max_expenses} expenses can be imported at once."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if request.content_type.startswith(CSVParser.media_type):
+            rows = [self.clean_csv_row(row) for row in rows]
+
+        serializer = ExpenseImportSerializer(data=rows, many=True, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        expenses_data = serializer.validated_data
+        groups = dict(
+            Group.objects.filter(pk__in={data["group"] for data in expenses_data}, users=request.user).values_list(
+                "pk", "title"
+            )
+        )
+        errors = self.check_members(expenses_data, groups)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        expenses = self.import_expenses(expenses_data, groups)
+        return Response(
+            {"count": len(expenses), "ids": [expense.pk for expense in expenses]}, status=status.HTTP_201_CREATED
+        )
+
+    @staticmethod
+    def clean_csv_row(row):
+        # Empty cells are missing values
+        row = {key: value for key, value in row.items() if key and value not in ("", None)}
+        if "participants" in row:
+            row["participants"] = [participant.strip() for participant in row["participants"].split(";")]
+        return row
+
+    @staticmethod
+    def check_members(expenses_data, groups):
+        # The errors of each expense, like a list serializer would report them
+        group_by_member = dict(Member.objects.filter(group_id__in=groups).values_list("pk", "group_id"))
+        errors = []
+        for data in expenses_data:
+            error = {}
+            if data["group"] not in groups:
+                error["group"] = [f'Invalid pk "{data["group"]}" - object does not exist.']
+            else:
+                if data["payer"] is not None and group_by_member.get(data["payer"]) != data["group"]:
+                    error["payer"] = ["The payer is not a member of the group."]
+                if any(group_by_member.get(member_id) != data["group"] for member_id in data["participants"]):
+                    error["participants"] = ["The participants must be members of the group."]
+            errors.append(error)
+        return errors
+
+    def import_expenses(self, expenses_data, groups):
+        lock_groups(groups)
+        expenses = Expense.objects.bulk_create(
+            [
+                Expense(
+                    title=data["title"],
+                    amount=data["amount"],
+                    description=data.get("description"),
+                    currency=data["currency"],
+                    date=data["date"],
+                    group_id=data["group"],
+                    payer_id=data["payer"],
+                )
+                for data in expenses_data
+            ]
+        )
+        Expense.participants.through.objects.bulk_create(
+            [
+                Expense.participants.through(expense_id=expense.pk, member_id=member_id)
+                for expense, data in zip(expenses, expenses_data)
+                for member_id in set(data["participants"])
+            ]
+        )
+        ExpenseShare.objects.bulk_create(
+            [
+                share
+                for expense, data in zip(expenses, expenses_data)
+                for share in get_expense_shares(
+                    {
+                        "id": expense.pk,
+                        "group": expense.group_id,
+                        "payer": expense.payer_id,
+                        "amount": expense.amount,
+                        "currency": expense.currency,
+                        "participants": [Member(pk=member_id) for member_id in set(data["participants"])],
+                    }
+                )
+            ]
+        )
+
+        imported_groups = {expense.group_id for expense in expenses}
+        Activity.objects.bulk_create(
+            [
+                Activity(
+                    user=self.request.user,
+                    text=f"{self.request.user.name} imported "
+                    f"{sum(expense.group_id == group_id for expense in expenses)} expenses "
+                    f'to group "{groups[group_id]}"',
+                    group_id=group_id,
+                )
+                for group_id in sorted(imported_groups)
+            ]
+        )
+        defer_balances_refresh(imported_groups)
+        defer_debts_recompute(imported_groups)
+        return expenses
+
+
+class ExpenseDetailView(UnitOfWorkMixin, generics.RetrieveUpdateDestroyAPIView, BaseExpenseView):
     def perform_update(self, serializer):
         instance = self.get_object()
         old_participants = instance._participants()
@@ -323,10 +612,13 @@ class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView, BaseExpenseView):
                     group=serializer.instance.group,
                 )
 
+        bump_versions({old_expense_info["group"], new_expense_info["group"]})
+
         if (
             old_expense_info["participants"] != new_expense_info["participants"]
             or old_expense_info["amount"] != new_expense_info["amount"]
             or old_expense_info["payer"] != new_expense_info["payer"]
+            or old_expense_info["currency"] != new_expense_info["currency"]
         ):
             # Trigger the custom signal
             expense_updated.send(
@@ -335,6 +627,10 @@ class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView, BaseExpenseView):
                 old_expense_info=old_expense_info,
                 new_expense_info=new_expense_info,
             )
+        else:
+            # The signal evicts the cached responses otherwise
+            group_ids = {old_expense_info["group"], new_expense_info["group"]}
+            apply_on_commit(lambda: evict_responses(group_ids))
 
     def perform_destroy(self, instance):
         instance = self.get_object()
@@ -354,7 +650,7 @@ class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView, BaseExpenseView):
 # Debt
 
 
-class DebtView(generics.ListAPIView):
+class DebtView(GroupETagMixin, ValuesListMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = DebtSerializer
 
@@ -373,7 +669,7 @@ class DebtView(generics.ListAPIView):
 # Balance
 
 
-class BalanceView(generics.ListAPIView):
+class BalanceView(GroupETagMixin, ValuesListMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = BalanceSerializer
 
@@ -429,6 +725,8 @@ class AcceptInviteView(APIView):
             )
         group = token.group
         group.users.add(request.user)
+        bump_versions([group.pk])
+        apply_on_commit(lambda: evict_responses([group.pk]))
         Activity.objects.create(
             user=self.request.user,
             text=f'New user has joined to group "{group.title}"',
@@ -469,10 +767,19 @@ class InviteGenerateView(APIView):
 # Invite User to Group
 
 
-class ActivityView(generics.ListAPIView):
+class ActivityView(GroupETagMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
-    queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityPagination
+
+    def get_queryset(self):
+        user_activities = Activity.objects.filter(group__in=Group.objects.filter(users=self.request.user))
+        group_id = self.request.query_params.get("group_id")
+
+        if group_id:
+            return user_activities.filter(group=group_id)
+
+        return user_activities
 
 
 ################################################################################
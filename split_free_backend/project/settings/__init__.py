@@ -22,6 +22,7 @@ include(
     "email.py",
     "database.py",
     "rest_framework.py",
+    "debts.py",
     optional(LOCAL_SETTINGS_PATH),
     "storages.py",
     "envvars.py",
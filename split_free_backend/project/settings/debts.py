@@ -0,0 +1,36 @@
+# Copyright (c) 2024 SplitFree Org.
+
+# Time in seconds the exact simplification of the debts of a group may take,
+# past which the remaining balances are settled greedily. None for no limit
+DEBTS_SETTLEMENT_TIME_BUDGET = 0.05
+
+# Groups with the "auto" settlement strategy having more members than this
+# are settled greedily, exact minimization not being realistic
+DEBTS_SETTLEMENT_EXACT_MAX_MEMBERS = 100
+
+# Number of settlements kept per process for groups having the same balances,
+# 0 to disable. The alias of a cache in CACHES can be given to share them
+# between processes as well
+DEBTS_SETTLEMENT_CACHE_SIZE = 1024
+DEBTS_SETTLEMENT_CACHE_BACKEND = None
+
+# Number of worker processes settling the currencies of a group concurrently,
+# 0 to settle them one after the other. Each process using them, like each web
+# worker, starts its own.
+DEBTS_SETTLEMENT_WORKERS = 0
+
+# How the writes to the balances and debts of a group are serialized: "row"
+# locks the group row, "advisory" takes a PostgreSQL advisory lock keyed by
+# the group id (falling back to "row" on other databases), None for no lock
+GROUP_WRITE_LOCK = "row"
+# Waits for the lock of a group longer than this many seconds are logged
+GROUP_WRITE_LOCK_SLOW_WAIT = 1.0
+
+# Refresh the balances and recompute the debts of the groups impacted by a
+# request after its transaction commits, rather than at the end of the request
+# within its transaction
+USE_ON_COMMIT_HOOK = False
+
+# Leave the recompute of the debts of the groups changed by the requests to
+# the run_debt_worker command, the requests only queue a job
+DEBTS_RECOMPUTE_ASYNC = False
@@ -1,13 +1,41 @@
 # Copyright (c) 2024 SplitFree Org.
 
 from datetime import timedelta
+from importlib.util import find_spec
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ],
+    # The JSON is encoded and decoded by orjson when installed, the stdlib
+    # otherwise, for the same wire format
+    "DEFAULT_RENDERER_CLASSES": [
+        "split_free_backend.core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "split_free_backend.core.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# MessagePack for the mobile clients when msgpack is installed, the amounts
+# being integer cents in that format
+if find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("split_free_backend.core.renderers.MessagePackRenderer")
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"].append("split_free_backend.core.parsers.MessagePackParser")
+
+# List the members, expenses, debts and balances straight from the columns the
+# serializers need rather than from model instances, for the same response
+FAST_LIST_SERIALIZATION = True
+
+# The alias of a cache in CACHES keeping the responses of the reads of the data
+# of a group per version of the group, None to disable. They are evicted when
+# the group changes, and expire after RESPONSE_CACHE_TIMEOUT seconds otherwise
+RESPONSE_CACHE_BACKEND = None
+RESPONSE_CACHE_TIMEOUT = 300
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=28),
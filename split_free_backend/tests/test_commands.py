@@ -0,0 +1,183 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from split_free_backend.core.algo_debts import calculate_new_debts, get_settlement_cache
+from split_free_backend.core.management.commands.recompute_debts import (
+    Command,
+    settle_group,
+)
+from split_free_backend.core.models import Balance, Debt, ExpenseShare, Group, Member
+
+
+class RecomputeDebtsMixin:
+    def create_group(self, title, amounts):
+        group = Group.objects.create(title=title)
+        for i, amount in enumerate(amounts):
+            member = Member.objects.create(name=f"Member{i}", group=group)
+            Balance.objects.create(amount=amount, owner=member, group=group)
+        calculate_new_debts(group)
+        return group
+
+    def get_debts(self, group):
+        return sorted(Debt.objects.filter(group=group).values_list("borrower_id", "lender_id", "amount", "currency"))
+
+    def recompute_debts(self, processes=0, **options):
+        out = StringIO()
+        call_command("recompute_debts", processes=processes, stdout=out, **options)
+        return out.getvalue()
+
+    def setUp(self):
+        get_settlement_cache.cache_clear()
+        self.groups = [
+            self.create_group("Group1", [-40, 20, 20]),
+            self.create_group("Group2", [-10, -7, -7, -5, -2, 1, 9, 9, 12]),
+            self.create_group("Group3", [-15.5, 5.25, 10.25]),
+        ]
+        self.expected_debts = [self.get_debts(group) for group in self.groups]
+        # Corrupt the debts of the first two groups
+        Debt.objects.filter(group=self.groups[0]).delete()
+        Debt.objects.filter(group=self.groups[1]).update(amount=1)
+
+
+class RecomputeDebtsTests(RecomputeDebtsMixin, TestCase):
+    def test_recompute_debts(self):
+        # Action
+        out = self.recompute_debts(chunk_size=2)
+
+        # Checks
+        self.assertEqual([self.get_debts(group) for group in self.groups], self.expected_debts)
+        self.assertIn(f"Group {self.groups[0].id}: debts changed", out)
+        self.assertIn(f"Group {self.groups[1].id}: debts changed", out)
+        self.assertNotIn(f"Group {self.groups[2].id}:", out)
+        self.assertIn("2/3 groups recomputed", out)
+        self.assertIn("3/3 groups recomputed, 2 with new debts", out)
+
+    def test_recompute_debts_with_constant_queries(self):
+        # Setup
+        self.groups.extend(self.create_group(f"Group{i}", [-3, 1, 2]) for i in range(4, 20))
+
+        # Action & Checks
+        # Count, chunk, balances, debts, savepoints, versions check, update,
+        # insert, new versions and the last empty chunk, the group locks aside
+        with override_settings(GROUP_WRITE_LOCK=None), self.assertNumQueries(11):
+            self.recompute_debts()
+
+    def recompute_debts_changing_group(self, changes, **options):
+        # The first group changes while the first `changes` groups are settled
+        calls = []
+
+        def settle_and_change_group(job):
+            calls.append(job)
+            if len(calls) <= changes:
+                Group.objects.filter(pk=self.groups[0].pk).update(version=F("version") + 1)
+            return settle_group(job)
+
+        with patch(
+            "split_free_backend.core.management.commands.recompute_debts.settle_group",
+            side_effect=settle_and_change_group,
+        ):
+            return self.recompute_debts(**options)
+
+    def test_groups_changed_during_the_recompute_are_retried(self):
+        # Action
+        out = self.recompute_debts_changing_group(changes=1)
+
+        # Checks
+        self.assertIn(f"Group {self.groups[0].id}: skipped, changed during the recompute", out)
+        self.assertIn("Retrying 1 groups changed during the recompute", out)
+        self.assertEqual([self.get_debts(group) for group in self.groups], self.expected_debts)
+        self.assertIn("2 of 3 groups got new debts", out)
+
+    def test_groups_changing_all_along_are_recomputed_locked(self):
+        # Action
+        out = self.recompute_debts_changing_group(changes=5)
+
+        # Checks
+        self.assertEqual(out.count(f"Group {self.groups[0].id}: skipped, changed during the recompute"), 3)
+        self.assertIn(f"Group {self.groups[0].id}: debts recomputed with the group locked", out)
+        self.assertEqual([self.get_debts(group) for group in self.groups], self.expected_debts)
+
+    def test_checkpoint_before_the_groups_to_retry(self):
+        # Setup
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "checkpoint")
+
+            # Action
+            # The run is interrupted before retrying the changed group
+            with patch.object(Command, "retry_groups", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.recompute_debts_changing_group(changes=1, checkpoint=checkpoint, chunk_size=1)
+
+            # Checks
+            with open(checkpoint) as f:
+                self.assertEqual(f.read(), str(self.groups[0].id - 1))
+
+    def test_dry_run(self):
+        # Setup
+        debts = [self.get_debts(group) for group in self.groups]
+
+        # Action
+        out = self.recompute_debts(dry_run=True)
+
+        # Checks
+        self.assertEqual([self.get_debts(group) for group in self.groups], debts)
+        self.assertIn(f"Group {self.groups[0].id}: debts would change", out)
+        self.assertIn(f"Group {self.groups[1].id}: debts would change", out)
+        self.assertIn("2 of 3 groups would have new debts", out)
+
+    def test_resume_from_checkpoint(self):
+        # Setup
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "checkpoint")
+            with open(checkpoint, "w") as f:
+                f.write(str(self.groups[0].id))
+            debts = self.get_debts(self.groups[0])
+
+            # Action
+            out = self.recompute_debts(checkpoint=checkpoint, chunk_size=1)
+
+            # Checks
+            self.assertIn(f"Resuming after group {self.groups[0].id}", out)
+            self.assertEqual(self.get_debts(self.groups[0]), debts)
+            self.assertEqual([self.get_debts(group) for group in self.groups[1:]], self.expected_debts[1:])
+            with open(checkpoint) as f:
+                self.assertEqual(f.read(), str(self.groups[2].id))
+
+    def test_refresh_balances(self):
+        # Setup
+        ExpenseShare.objects.create(member=self.groups[2].members.first(), group=self.groups[2], owed_cents=100)
+        ExpenseShare.objects.create(member=self.groups[2].members.last(), group=self.groups[2], paid_cents=100)
+
+        # Action
+        self.recompute_debts(refresh_balances=True)
+
+        # Checks
+        # The balances only come from the ledger, the debts follow them
+        self.assertEqual(
+            list(Balance.objects.filter(group=self.groups[2]).order_by("owner_id").values_list("amount", flat=True)),
+            [1, 0, -1],
+        )
+        self.assertEqual(
+            self.get_debts(self.groups[2]),
+            [(self.groups[2].members.first().id, self.groups[2].members.last().id, 1, "EUR")],
+        )
+        self.assertFalse(Debt.objects.filter(group=self.groups[0]).exists())
+
+
+class RecomputeDebtsWithWorkerProcessesTests(RecomputeDebtsMixin, TransactionTestCase):
+    # The connections are closed before forking the workers, which would end
+    # the transaction of a TestCase
+    def test_recompute_debts_with_worker_processes(self):
+        # Action
+        self.recompute_debts(processes=2, chunk_size=2)
+
+        # Checks
+        self.assertEqual([self.get_debts(group) for group in self.groups], self.expected_debts)
@@ -1,14 +1,24 @@
 # Copyright (c) 2023 SplitFree Org.
+import tempfile
+from contextlib import contextmanager
 from copy import copy
 from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
 from unittest.mock import patch
 
-from django.db import IntegrityError
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from split_free_backend.benchmarks.serialization import run_benchmark
+from split_free_backend.core.algo_debts import calculate_new_debts
+from split_free_backend.core.debt_queue import run_batch
 from split_free_backend.core.helpers import get_auth_headers
 from split_free_backend.core.models import (
     Activity,
@@ -20,11 +30,14 @@ from split_free_backend.core.models import (
     Member,
     User,
 )
+from split_free_backend.core.renderers import msgpack
+from split_free_backend.core.response_cache import response_cache_stats
 from split_free_backend.core.serializers import (
     ExpenseSerializer,
     GroupSerializer,
     MemberSerializer,
 )
+from split_free_backend.core.views import GroupDetailView
 
 
 class BaseAPITestCase(TestCase):
@@ -41,6 +54,14 @@ class BaseAPITestCase(TestCase):
         refresh = RefreshToken.for_user(self.user)
         self.access_token = str(refresh.access_token)
 
+    @contextmanager
+    def assertNumSelects(self, number):
+        # Like assertNumQueries, without the savepoints of ATOMIC_REQUESTS
+        with CaptureQueriesContext(connection) as context:
+            yield
+        selects = [query["sql"] for query in context.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), number, "\n".join(selects))
+
 
 class MemberCRUDTests(BaseAPITestCase):
     def setUp(self):
@@ -373,6 +394,36 @@ class GroupCRUDTests(BaseAPITestCase):
         )
         self.assertEqual(activities[1].group, self.group)
 
+    def test_update_group_keeps_concurrent_changes(self):
+        # Setup
+        self.create_group_with_orm()
+        get_object = GroupDetailView.get_object
+
+        def get_object_and_recompute_debts(view):
+            # The debts are recomputed once the group is read
+            group = get_object(view)
+            Group.objects.filter(pk=group.pk).update(
+                version=F("version") + 4, debts_version=F("version") + 4, debts_optimal=False
+            )
+            return group
+
+        # Action
+        with patch.object(GroupDetailView, "get_object", get_object_and_recompute_debts):
+            response = self.client.patch(
+                f"/api/groups/{self.group.id}/",
+                {"title": "Workshop", "member_names": ["Member1", "Member2"]},
+                content_type="application/json",
+                headers=get_auth_headers(self.access_token),
+            )
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.title, "Workshop")
+        self.assertEqual((self.group.version, self.group.debts_version), (5, 5))
+        self.assertFalse(self.group.debts_optimal)
+        self.assertEqual(response.data, GroupSerializer(self.group).data)
+
     def test_delete_group(self):
         # Setup
         self.create_group_with_orm()
@@ -422,6 +473,429 @@ class GroupCRUDTests(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class GroupSummaryTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(title="Test Group", description="Group for testing")
+        self.group.users.add(self.user)
+
+    def add_members_and_expenses(self, number_of_members, number_of_expenses):
+        start = Member.objects.filter(group=self.group).count()
+        members = [
+            Member.objects.create(name=f"Member{i}", group=self.group) for i in range(start, start + number_of_members)
+        ]
+        for member in members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+        for i in range(number_of_expenses):
+            expense = Expense.objects.create(
+                title=f"Expense{i}", amount=10.00, group=self.group, payer=members[i % number_of_members]
+            )
+            expense.participants.set(members)
+        return members
+
+    def get_summary(self, query=""):
+        return self.client.get(
+            f"/api/groups/{self.group.id}/summary/{query}", headers=get_auth_headers(self.access_token)
+        )
+
+    def test_get_group_summary(self):
+        # Setup
+        members = self.add_members_and_expenses(2, 3)
+
+        # Action
+        response = self.get_summary("?expenses=2")
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["group"], GroupSerializer(Group.objects.get(pk=self.group.pk)).data)
+        self.assertEqual([member["id"] for member in response.data["members"]], [member.id for member in members])
+        self.assertEqual(
+            [[balance["amount"] for balance in member["balances"]] for member in response.data["members"]],
+            [
+                [str(balance.amount) for balance in member.balances.all()]
+                for member in Member.objects.filter(group=self.group).order_by("id")
+            ],
+        )
+        self.assertEqual(len(response.data["debts"]), Debt.objects.filter(group=self.group).count())
+        # Latest first
+        self.assertEqual([expense["title"] for expense in response.data["expenses"]], ["Expense2", "Expense1"])
+
+    def test_get_group_summary_with_constant_queries(self):
+        # Action
+        queries = []
+        for number_of_members, number_of_expenses in ((2, 2), (6, 10)):
+            self.add_members_and_expenses(number_of_members, number_of_expenses)
+            with CaptureQueriesContext(connection) as context:
+                response = self.get_summary()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            queries.append(len(context))
+
+        # Checks
+        self.assertEqual(queries[0], queries[1])
+
+    def test_no_summary_of_other_users_groups(self):
+        # Setup
+        self.group.users.remove(self.user)
+
+        # Action
+        response = self.get_summary()
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class GroupETagTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(title="Test Group", description="Group for testing")
+        self.group.users.add(self.user)
+        self.members = [Member.objects.create(name=f"Member{i}", group=self.group) for i in range(2)]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+
+    def get(self, url, etag=None):
+        headers = get_auth_headers(self.access_token)
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.client.get(url, headers=headers)
+
+    def send(self, method, url, data):
+        response = getattr(self.client, method)(
+            url, data, content_type="application/json", headers=get_auth_headers(self.access_token)
+        )
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+
+    def test_not_modified(self):
+        for url in (
+            f"/api/balances/?group_id={self.group.id}",
+            f"/api/debts/?group_id={self.group.id}",
+            f"/api/expenses/?group_id={self.group.id}",
+            f"/api/members/?group_id={self.group.id}",
+            f"/api/activities/?group_id={self.group.id}",
+            f"/api/groups/{self.group.id}/",
+            f"/api/groups/{self.group.id}/summary/",
+        ):
+            with self.subTest(url=url):
+                # Setup
+                etag = self.get(url)["ETag"]
+
+                # Action
+                # The user and the version are looked up
+                with self.assertNumSelects(2):
+                    response = self.get(url, etag)
+
+                # Checks
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response.content, b"")
+                self.assertEqual(response["ETag"], etag)
+
+    def test_new_version_on_changes(self):
+        # Setup
+        summary_url = f"/api/groups/{self.group.id}/summary/"
+        participants = [member.id for member in self.members]
+        expense_id = self.send(
+            "post",
+            "/api/expenses/",
+            {"amount": 10, "title": "Coffee", "group": self.group.id, "participants": participants},
+        ).data["id"]
+        invite_token = InviteToken.objects.create(group=self.group)
+
+        for change, method, url, data in (
+            ("add member", "post", "/api/members/", {"name": "Member2", "group": self.group.id}),
+            ("rename member", "patch", f"/api/members/{self.members[0].id}/", {"name": "Apo"}),
+            (
+                "add expense",
+                "post",
+                "/api/expenses/",
+                {"amount": 20, "title": "Tea", "group": self.group.id, "participants": participants},
+            ),
+            ("rename expense", "patch", f"/api/expenses/{expense_id}/", {"title": "Coffees"}),
+            ("rename group", "patch", f"/api/groups/{self.group.id}/", {"title": "Friends"}),
+            ("accept invite", "post", "/api/invite/accept/", {"invite_token": invite_token.token}),
+        ):
+            with self.subTest(change=change):
+                etag = self.get(summary_url)["ETag"]
+
+                # Action
+                self.send(method, url, data)
+                response = self.get(summary_url, etag)
+
+                # Checks
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(DEBTS_RECOMPUTE_ASYNC=True)
+    def test_new_version_on_debts_recompute(self):
+        # Setup
+        self.send(
+            "post",
+            "/api/expenses/",
+            {
+                "amount": 10,
+                "title": "Coffee",
+                "group": self.group.id,
+                "payer": self.members[0].id,
+                "participants": [member.id for member in self.members],
+            },
+        )
+        url = f"/api/debts/?group_id={self.group.id}"
+        etag = self.get(url)["ETag"]
+
+        # Action
+        run_batch()
+        response = self.get(url, etag)
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data), 1)
+
+    @override_settings(DEBTS_RECOMPUTE_ASYNC=True)
+    def test_new_version_on_unchanged_debts_recompute(self):
+        # Setup
+        # The payer's own share changes no debt
+        self.send(
+            "post",
+            "/api/expenses/",
+            {
+                "amount": 10,
+                "title": "Coffee",
+                "group": self.group.id,
+                "payer": self.members[0].id,
+                "participants": [self.members[0].id],
+            },
+        )
+        url = f"/api/groups/{self.group.id}/"
+        etag = self.get(url)["ETag"]
+
+        # Action
+        run_batch()
+        response = self.get(url, etag)
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["debts_version"], response.data["version"])
+
+    @override_settings(USE_ON_COMMIT_HOOK=True, DEBTS_RECOMPUTE_ASYNC=True)
+    def test_new_version_on_balances_refreshed_after_commit(self):
+        # Setup
+        # Only the balances are refreshed after the commit, the debts later
+        url = f"/api/groups/{self.group.id}/summary/"
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.send(
+                "post",
+                "/api/expenses/",
+                {
+                    "amount": 10,
+                    "title": "Coffee",
+                    "group": self.group.id,
+                    "payer": self.members[0].id,
+                    "participants": [member.id for member in self.members],
+                },
+            )
+        etag = self.get(url)["ETag"]
+
+        # Action
+        for callback in callbacks:
+            callback()
+        response = self.get(url, etag)
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            [[balance["amount"] for balance in member["balances"]] for member in response.data["members"]],
+            [["-5.00"], ["5.00"]],
+        )
+
+    def test_no_etag_without_a_group_of_the_user(self):
+        # Setup
+        other_group = Group.objects.create(title="Other Group")
+
+        for url in ("/api/balances/", f"/api/balances/?group_id={other_group.id}"):
+            with self.subTest(url=url):
+                # Action
+                response = self.get(url, "*")
+
+                # Checks
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn("ETag", response)
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_etag_per_format(self):
+        # Action
+        url = f"/api/balances/?group_id={self.group.id}"
+        response = self.get(f"{url}&format=msgpack", self.get(url)["ETag"])
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Accept", response["Vary"])
+
+
+@override_settings(RESPONSE_CACHE_BACKEND="default")
+class ResponseCacheTests(GroupETagTests):
+    urls = (
+        "/api/balances/?group_id={group_id}",
+        "/api/debts/?group_id={group_id}",
+        "/api/expenses/?group_id={group_id}",
+        "/api/members/?group_id={group_id}",
+        "/api/activities/?group_id={group_id}",
+        "/api/groups/{group_id}/",
+        "/api/groups/{group_id}/summary/",
+    )
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        response_cache_stats.clear()
+
+    def test_cached_responses(self):
+        for url in self.urls:
+            url = url.format(group_id=self.group.id)
+            with self.subTest(url=url):
+                # Setup
+                response_cache_stats.clear()
+                expected = self.get(url)
+
+                # Action
+                # The user and the version are looked up
+                with self.assertNumSelects(2):
+                    response = self.get(url)
+
+                # Checks
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response["Content-Type"], expected["Content-Type"])
+                self.assertEqual(response["ETag"], expected["ETag"])
+                self.assertEqual(response_cache_stats.stats(), {"hits": 1, "misses": 1, "stores": 1, "evictions": 0})
+
+    def test_evicted_on_changes(self):
+        # Setup
+        urls = [url.format(group_id=self.group.id) for url in self.urls]
+        participants = [member.id for member in self.members]
+        expense_id = self.send(
+            "post",
+            "/api/expenses/",
+            {"amount": 10, "title": "Coffee", "group": self.group.id, "participants": participants},
+        ).data["id"]
+        invite_token = InviteToken.objects.create(group=self.group)
+
+        for change, method, url, data in (
+            ("add member", "post", "/api/members/", {"name": "Member2", "group": self.group.id}),
+            ("rename member", "patch", f"/api/members/{self.members[0].id}/", {"name": "Apo"}),
+            (
+                "add expense",
+                "post",
+                "/api/expenses/",
+                {"amount": 20, "title": "Tea", "group": self.group.id, "participants": participants},
+            ),
+            ("rename expense", "patch", f"/api/expenses/{expense_id}/", {"title": "Coffees"}),
+            ("delete expense", "delete", f"/api/expenses/{expense_id}/", {}),
+            ("delete member", "delete", f"/api/members/{self.members[1].id}/", {}),
+            ("accept invite", "post", "/api/invite/accept/", {"invite_token": invite_token.token}),
+            ("rename group", "patch", f"/api/groups/{self.group.id}/", {"title": "Friends"}),
+        ):
+            with self.subTest(change=change):
+                for read_url in urls:
+                    self.get(read_url)
+                response_cache_stats.clear()
+
+                # Action
+                self.send(method, url, data)
+
+                # Checks
+                self.assertEqual(response_cache_stats.evictions, len(urls))
+                for read_url in urls:
+                    self.get(read_url)
+                self.assertEqual(response_cache_stats.hits, 0)
+
+    @override_settings(USE_ON_COMMIT_HOOK=True, DEBTS_RECOMPUTE_ASYNC=True)
+    def test_not_served_after_deferred_work(self):
+        # Setup
+        urls = [url.format(group_id=self.group.id) for url in self.urls[-2:]]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.send(
+                "post",
+                "/api/expenses/",
+                {
+                    "amount": 10,
+                    "title": "Coffee",
+                    "group": self.group.id,
+                    "payer": self.members[0].id,
+                    "participants": [member.id for member in self.members],
+                },
+            )
+
+        for work in ("balances refresh", "debts recompute"):
+            with self.subTest(work=work):
+                expected = [self.get(url).content for url in urls]
+                response_cache_stats.clear()
+
+                # Action
+                if work == "balances refresh":
+                    for callback in callbacks:
+                        callback()
+                else:
+                    run_batch()
+
+                # Checks
+                self.assertTrue(all(self.get(url).content != content for url, content in zip(urls, expected)))
+                self.assertEqual(response_cache_stats.hits, 0)
+
+    def test_not_cached_for_other_users(self):
+        # Setup
+        url = f"/api/members/?group_id={self.group.id}"
+        self.get(url)
+        other_user = User.objects.create(email="otheruser@splitmail.com", password="testpassword", is_active=True)
+        headers = get_auth_headers(str(RefreshToken.for_user(other_user).access_token))
+
+        # Action
+        response = self.client.get(url, headers=headers)
+
+        # Checks
+        self.assertEqual(response.data, [])
+        self.assertNotIn("ETag", response)
+        self.assertEqual(response_cache_stats.hits, 0)
+
+    def test_browsable_api_not_cached(self):
+        # Action
+        url = f"/api/members/?group_id={self.group.id}&format=api"
+        self.get(url)
+        self.get(url)
+
+        # Checks
+        self.assertEqual(response_cache_stats.stats(), {"hits": 0, "misses": 0, "stores": 0, "evictions": 0})
+
+    def test_file_based_cache(self):
+        # Setup
+        url = f"/api/expenses/?group_id={self.group.id}"
+        with tempfile.TemporaryDirectory() as location:
+            responses_cache = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}
+            with override_settings(
+                CACHES={
+                    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                    "responses": responses_cache,
+                },
+                RESPONSE_CACHE_BACKEND="responses",
+            ):
+                expected = self.get(url).content
+
+                # Action
+                response = self.get(url)
+                self.send(
+                    "post",
+                    "/api/expenses/",
+                    {"amount": 20, "title": "Tea", "group": self.group.id, "participants": [self.members[0].id]},
+                )
+
+                # Checks
+                self.assertEqual(response.content, expected)
+                self.assertEqual(response_cache_stats.stats(), {"hits": 1, "misses": 1, "stores": 1, "evictions": 1})
+                self.assertEqual(len(self.get(url).data), 1)
+
+
 class ExpenseCRUDTests(BaseAPITestCase):
     def setUp(self):
         super().setUp()
@@ -531,7 +1005,7 @@ class ExpenseCRUDTests(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, ExpenseSerializer(expense).data)
 
-    @patch("split_free_backend.core.signals.calculate_new_debts", side_effect=lambda group: None)
+    @patch("split_free_backend.core.unit_of_work.calculate_new_debts", side_effect=lambda group: None)
     def test_update_expense(self, _):
         # Setup
         expense = Expense.objects.create(
@@ -634,6 +1108,391 @@ class ExpenseCRUDTests(BaseAPITestCase):
         self.assertEqual(Activity.objects.get().group, self.group)
 
 
+class ExpenseBulkTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(title="Test Group", description="Group for testing")
+        self.group.users.add(self.user)
+        self.members = [Member.objects.create(name=f"Member{i}", group=self.group) for i in range(3)]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+
+    def import_expenses(self, data, content_type="application/json"):
+        return self.client.post(
+            "/api/expenses/bulk/",
+            data,
+            content_type=content_type,
+            headers=get_auth_headers(self.access_token),
+        )
+
+    def get_expense_data(self, amount, payer):
+        return {
+            "title": "Coffee",
+            "amount": amount,
+            "group": self.group.id,
+            "payer": payer.id,
+            "participants": [member.id for member in self.members],
+        }
+
+    def test_import_expenses(self):
+        # Action
+        with patch("split_free_backend.core.unit_of_work.calculate_new_debts", wraps=calculate_new_debts) as mock:
+            response = self.import_expenses(
+                [self.get_expense_data("30.00", self.members[0]), self.get_expense_data("60.00", self.members[1])]
+            )
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 2)
+        self.assertEqual(Expense.objects.get(pk=response.data["ids"][0]).participants.count(), 3)
+        balances = [Balance.objects.get(owner=member).amount for member in self.members]
+        self.assertEqual(balances, [0, -30, 30])
+        self.assertEqual(Debt.objects.filter(group=self.group).count(), 1)
+        # A single recompute and activity for the whole import
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(Activity.objects.get(group=self.group).text, 'None imported 2 expenses to group "Test Group"')
+
+    def test_import_expenses_from_csv(self):
+        # Setup
+        participants = ";".join(str(member.id) for member in self.members[:2])
+        data = (
+            "title,amount,currency,group,payer,participants\n"
+            f"Taxi,10.00,USD,{self.group.id},{self.members[0].id},{participants}\n"
+            f"Free,5.00,EUR,{self.group.id},,{participants}\n"
+        )
+
+        # Action
+        response = self.import_expenses(data, content_type="text/csv")
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(Expense.objects.order_by("id").values_list("title", "currency")), [("Taxi", "USD"), ("Free", "EUR")]
+        )
+        # The free expense is in another currency
+        self.assertEqual(Balance.objects.get(owner=self.members[1], currency="USD").amount, 5)
+        self.assertEqual(Balance.objects.get(owner=self.members[1], currency="EUR").amount, 0)
+
+    def test_import_invalid_expenses(self):
+        # Setup
+        other_group = Group.objects.create(title="Other Group")
+        outsider = Member.objects.create(name="Outsider", group=other_group)
+        expenses = [self.get_expense_data("30.00", self.members[0]) for _ in range(3)]
+        expenses[1]["participants"].append(outsider.id)
+        expenses[2]["group"] = other_group.id
+
+        # Action
+        response = self.import_expenses(expenses)
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("participants", response.data[1])
+        self.assertIn("group", response.data[2])
+        self.assertFalse(Expense.objects.exists())
+
+        response = self.import_expenses([{"title": "Coffee"}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("amount", response.data[0])
+
+    def test_import_expenses_with_constant_queries(self):
+        # Action
+        queries = []
+        for number_of_expenses in (10, 200):
+            with CaptureQueriesContext(connection) as context:
+                response = self.import_expenses(
+                    [self.get_expense_data("10.00", self.members[i % 3]) for i in range(number_of_expenses)]
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            queries.append(len(context))
+
+        # Checks
+        # Only the bulk inserts may take a few more batches, SQLite capping the
+        # number of parameters of a query
+        self.assertLessEqual(queries[1] - queries[0], 10)
+
+
+class ActivityTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.groups = [Group.objects.create(title=f"Group{i}") for i in range(2)]
+        for group in self.groups:
+            group.users.add(self.user)
+        other_group = Group.objects.create(title="Other Group")
+        self.activities = [
+            Activity.objects.create(text=f"Activity{i}", group=self.groups[i % 2], user=self.user) for i in range(5)
+        ]
+        Activity.objects.create(text="Someone else's activity", group=other_group)
+
+    def get_activities(self, url):
+        response = self.client.get(url, headers=get_auth_headers(self.access_token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_list_activities_of_the_user_groups(self):
+        # Action
+        data = self.get_activities("/api/activities/")
+
+        # Checks
+        # Newest first
+        self.assertEqual(
+            [activity["text"] for activity in data["results"]], [f"Activity{i}" for i in range(4, -1, -1)]
+        )
+        self.assertIsNone(data["next"])
+
+    def test_list_activities_of_a_group(self):
+        # Action
+        data = self.get_activities(f"/api/activities/?group_id={self.groups[1].id}")
+
+        # Checks
+        self.assertEqual([activity["text"] for activity in data["results"]], ["Activity3", "Activity1"])
+
+    def test_paginate_activities(self):
+        # Action
+        texts = []
+        url = "/api/activities/?page_size=2"
+        while url:
+            data = self.get_activities(url)
+            self.assertLessEqual(len(data["results"]), 2)
+            texts.extend(activity["text"] for activity in data["results"])
+            url = data["next"]
+
+        # Checks
+        self.assertEqual(texts, [f"Activity{i}" for i in range(4, -1, -1)])
+
+    def test_paginate_activities_of_the_same_date(self):
+        # Setup
+        Activity.objects.update(date=timezone.now())
+
+        # Action
+        pages = []
+        url = "/api/activities/?page_size=2"
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                data = self.get_activities(url)
+                pages.append([activity["text"] for activity in data["results"]])
+                url = data["next"]
+        previous_pages = []
+        while data["previous"]:
+            data = self.get_activities(data["previous"])
+            previous_pages.append([activity["text"] for activity in data["results"]])
+
+        # Checks
+        # The activities of the same date follow their ids, and none is skipped
+        # with an offset
+        self.assertEqual(pages, [["Activity4", "Activity3"], ["Activity2", "Activity1"], ["Activity0"]])
+        self.assertFalse(any("OFFSET" in query["sql"].upper() for query in queries.captured_queries))
+        self.assertEqual(previous_pages, pages[-2::-1])
+
+
+class ListQueryBudgetTests(BaseAPITestCase):
+    # The number of queries of the list endpoints must not grow with the
+    # number of rows listed
+    def setUp(self):
+        super().setUp()
+        self.number_of_groups = 0
+
+    def add_groups(self, number_of_groups):
+        # Rows are inserted in bulk, without the signals
+        groups = Group.objects.bulk_create(
+            [Group(title=f"Group{self.number_of_groups + i}") for i in range(number_of_groups)]
+        )
+        self.number_of_groups += number_of_groups
+        for group in groups:
+            group.users.add(self.user)
+            members = Member.objects.bulk_create([Member(name=f"Member{i}", group=group) for i in range(3)])
+            Balance.objects.bulk_create([Balance(owner=member, group=group, amount=0.00) for member in members])
+            Debt.objects.create(group=group, borrower=members[0], lender=members[1], amount=1.00)
+            Activity.objects.create(text="Activity", group=group, user=self.user)
+            for i in range(2):
+                expense = Expense.objects.bulk_create(
+                    [Expense(title=f"Expense{i}", amount=10.00, group=group, payer=members[i])]
+                )[0]
+                expense.participants.add(*members)
+
+    def assertQueryBudget(self, url, budget):
+        # The budget holds for a few rows and for many more
+        for number_of_groups in (1, 10):
+            self.add_groups(number_of_groups)
+            with self.assertNumSelects(budget):
+                response = self.client.get(url, headers=get_auth_headers(self.access_token))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_members(self):
+        self.assertQueryBudget("/api/members/", 2)
+
+    def test_list_groups(self):
+        self.assertQueryBudget("/api/groups/", 3)
+
+    def test_list_expenses(self):
+        self.assertQueryBudget("/api/expenses/", 3)
+
+    def test_list_debts(self):
+        self.assertQueryBudget("/api/debts/", 2)
+
+    def test_list_balances(self):
+        self.assertQueryBudget("/api/balances/", 2)
+
+    def test_list_activities(self):
+        self.assertQueryBudget("/api/activities/", 2)
+
+
+class ValuesListTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(title="Test Group")
+        self.group.users.add(self.user)
+        # Rows are inserted in bulk, without the signals
+        members = Member.objects.bulk_create([Member(name=f"Member{i}", group=self.group) for i in range(4)])
+        Balance.objects.bulk_create(
+            [
+                Balance(owner=members[0], group=self.group, amount=-12.5),
+                Balance(owner=members[1], group=self.group, amount=10),
+                Balance(owner=members[2], group=self.group, amount=2.5, currency="USD"),
+            ]
+        )
+        Debt.objects.create(group=self.group, borrower=members[1], lender=members[0], amount=10)
+        expenses = Expense.objects.bulk_create(
+            [
+                Expense(title="Dinner", amount=30, group=self.group, payer=members[0], description="Pizza"),
+                Expense(title="Taxi", amount=7.5, group=self.group, currency="USD"),
+                Expense(title="Nothing", amount=0, group=self.group, payer=members[3]),
+            ]
+        )
+        expenses[0].participants.add(members[2], members[0], members[1])
+        expenses[1].participants.add(members[3], members[2])
+
+    def get_content(self, url):
+        response = self.client.get(url, headers=get_auth_headers(self.access_token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content
+
+    def test_same_content_as_the_serializers(self):
+        for url in ("/api/members/", "/api/expenses/", "/api/debts/", "/api/balances/", "/api/debts/?group_id=0"):
+            with self.subTest(url=url):
+                # Action
+                content = self.get_content(url)
+                with override_settings(FAST_LIST_SERIALIZATION=False):
+                    serializer_content = self.get_content(url)
+
+                # Checks
+                self.assertEqual(content, serializer_content)
+
+    def test_benchmark(self):
+        # Action
+        results = run_benchmark(rows=[5])
+
+        # Checks
+        self.assertEqual([result["endpoint"] for result in results], ["members", "expenses", "debts", "balances"])
+        self.assertTrue(all(result["identical"] for result in results))
+
+
+@skipUnless(msgpack, "msgpack is not installed")
+class MessagePackTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(title="Test Group")
+        self.group.users.add(self.user)
+        self.members = [Member.objects.create(name=f"Member{i}", group=self.group) for i in range(2)]
+        Balance.objects.create(owner=self.members[0], group=self.group, amount=-12.5)
+        Balance.objects.create(owner=self.members[1], group=self.group, amount=12.5)
+        Debt.objects.create(group=self.group, borrower=self.members[1], lender=self.members[0], amount=12.5)
+        # Inserted in bulk, without the signals
+        self.expense = Expense.objects.bulk_create(
+            [Expense(title="Dinner", amount=25, group=self.group, payer=self.members[0])]
+        )[0]
+        self.expense.participants.add(*self.members)
+
+    def request(self, method, url, data=None):
+        headers = {**get_auth_headers(self.access_token), "Accept": "application/msgpack"}
+        if method == "get":
+            response = self.client.get(url, headers=headers)
+        else:
+            response = getattr(self.client, method)(
+                url, msgpack.packb(data), content_type="application/msgpack", headers=headers
+            )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        return response, msgpack.unpackb(response.content)
+
+    def test_list_amounts_in_cents(self):
+        for fast_list_serialization in (True, False):
+            with self.subTest(fast_list_serialization=fast_list_serialization):
+                with override_settings(FAST_LIST_SERIALIZATION=fast_list_serialization):
+                    # Action
+                    _, balances = self.request("get", "/api/balances/")
+                    _, debts = self.request("get", "/api/debts/")
+                    _, expenses = self.request("get", "/api/expenses/")
+
+                # Checks
+                self.assertEqual([balance["amount"] for balance in balances], [-1250, 1250])
+                self.assertEqual([debt["amount"] for debt in debts], [1250])
+                self.assertEqual(
+                    expenses,
+                    [
+                        {
+                            **ExpenseSerializer(self.expense).data,
+                            "amount": 2500,
+                            "participants": [member.id for member in self.members],
+                        }
+                    ],
+                )
+
+    def test_get_group_summary_amounts_in_cents(self):
+        # Action
+        response, data = self.request("get", f"/api/groups/{self.group.id}/summary/")
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([member["balances"][0]["amount"] for member in data["members"]], [-1250, 1250])
+        self.assertEqual(data["debts"][0]["amount"], 1250)
+        self.assertEqual(data["expenses"][0]["amount"], 2500)
+
+    def test_create_expense_with_amount_in_cents(self):
+        # Action
+        response, data = self.request(
+            "post",
+            "/api/expenses/",
+            {
+                "amount": 1999,
+                "title": "Taxi",
+                "payer": self.members[1].id,
+                "group": self.group.id,
+                "participants": [member.id for member in self.members],
+            },
+        )
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(data["amount"], 1999)
+        self.assertEqual(Expense.objects.get(pk=data["id"]).amount, Decimal("19.99"))
+
+    def test_import_expenses_with_amounts_in_cents(self):
+        # Action
+        response, data = self.request(
+            "post",
+            "/api/expenses/bulk/",
+            [{"title": "Coffee", "amount": 350, "group": self.group.id, "payer": self.members[0].id}],
+        )
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Expense.objects.get(pk=data["ids"][0]).amount, Decimal("3.50"))
+
+    def test_invalid_content(self):
+        # Action
+        response = self.client.post(
+            "/api/expenses/",
+            b"\xc1",
+            content_type="application/msgpack",
+            headers={**get_auth_headers(self.access_token), "Accept": "application/msgpack"},
+        )
+
+        # Checks
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("MessagePack parse error", msgpack.unpackb(response.content)["detail"])
+
+
 class DebtTests(BaseAPITestCase):
     def setUp(self):
         super().setUp()
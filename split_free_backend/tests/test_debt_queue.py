@@ -0,0 +1,129 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+
+from split_free_backend.core import debt_queue
+from split_free_backend.core.debt_queue import enqueue_debts_recompute, run_batch
+from split_free_backend.core.models import (
+    Balance,
+    Debt,
+    DebtRecomputeJob,
+    Expense,
+    Group,
+    Member,
+)
+from split_free_backend.core.signals import (
+    handle_expense_created,
+    handle_group_created,
+    remove_debts_and_transfers,
+)
+from split_free_backend.core.unit_of_work import unit_of_work
+
+
+@override_settings(DEBTS_RECOMPUTE_ASYNC=True)
+class DebtQueueTests(TestCase):
+    def setUp(self):
+        # The group signal tests leave it connected
+        post_save.disconnect(handle_group_created, sender=Group)
+        self.groups = [Group.objects.create(title=f"Group{i}") for i in range(2)]
+        self.members = [
+            Member.objects.create(name=name, group=self.groups[0]) for name in ("Apo", "Michael", "Jeremy")
+        ]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.groups[0], amount=0.00)
+
+    def create_expense(self, amount, payer):
+        expense = Expense.objects.create(amount=amount, title="Dinner", group=self.groups[0], payer=payer)
+        expense.participants.set(self.members)
+        handle_expense_created(sender=None, instance=expense)
+
+    def test_requests_queue_the_debts_recompute(self):
+        # Action
+        with unit_of_work():
+            self.create_expense(Decimal("30.00"), self.members[0])
+            self.create_expense(Decimal("60.00"), self.members[1])
+
+        # Checks
+        # The balances are up to date but not the debts yet
+        self.assertEqual(Balance.objects.get(owner=self.members[2]).amount, 30)
+        self.assertFalse(Debt.objects.exists())
+        self.assertEqual(DebtRecomputeJob.objects.get().group, self.groups[0])
+        group = Group.objects.get(pk=self.groups[0].pk)
+        self.assertEqual((group.version, group.debts_version), (1, 0))
+
+        # The worker recomputes them
+        self.assertEqual(run_batch(), 1)
+        self.assertEqual(Debt.objects.count(), 1)
+        group.refresh_from_db()
+        self.assertEqual(group.debts_version, group.version)
+        self.assertFalse(DebtRecomputeJob.objects.exists())
+        self.assertEqual(run_batch(), 0)
+
+    def test_jobs_of_the_same_group_deduplicated(self):
+        # Setup
+        enqueue_debts_recompute([self.groups[0].id])
+        enqueue_debts_recompute([self.groups[1].id, self.groups[0].id])
+
+        # Action
+        groups = run_batch(batch_size=1)
+
+        # Checks
+        self.assertEqual(groups, 1)
+        self.assertEqual(DebtRecomputeJob.objects.get().group, self.groups[1])
+
+    def test_each_group_recomputed_on_its_own(self):
+        # Setup
+        enqueue_debts_recompute([group.id for group in self.groups])
+
+        # Action
+        with patch.object(debt_queue, "calculate_new_debts", side_effect=[None, ValueError]):
+            with self.assertRaises(ValueError):
+                run_batch()
+
+        # Checks
+        # The first group was recomputed, committed before the second one failed
+        self.assertEqual(DebtRecomputeJob.objects.get().group, self.groups[1])
+
+    def test_member_removal_recomputes_the_debts_first(self):
+        # Setup
+        self.create_expense(Decimal("30.00"), self.members[0])
+        self.assertFalse(Debt.objects.exists())
+
+        # Action
+        remove_debts_and_transfers(sender=None, instance=self.members[2])
+        self.members[2].delete()
+
+        # Checks
+        # Jeremy's debt to Apo was written off
+        self.assertEqual(
+            [Balance.objects.get(owner=member).amount for member in self.members[:2]], [Decimal(-10), Decimal(10)]
+        )
+
+    def test_run_debt_worker(self):
+        # Setup
+        enqueue_debts_recompute([group.id for group in self.groups])
+
+        # Action
+        out = StringIO()
+        call_command("run_debt_worker", once=True, stdout=out)
+
+        # Checks
+        self.assertIn("Recomputed the debts of 2 groups in total", out.getvalue())
+        self.assertFalse(DebtRecomputeJob.objects.exists())
+
+    @override_settings(DEBTS_RECOMPUTE_ASYNC=False)
+    def test_debts_up_to_date_without_the_queue(self):
+        # Action
+        self.create_expense(Decimal("30.00"), self.members[0])
+
+        # Checks
+        group = Group.objects.get(pk=self.groups[0].pk)
+        # A version for the new balances, then one for the new debts
+        self.assertEqual((group.version, group.debts_version), (2, 2))
+        self.assertFalse(DebtRecomputeJob.objects.exists())
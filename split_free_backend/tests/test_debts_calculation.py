@@ -1,24 +1,36 @@
 # Copyright (c) 2023 SplitFree Org.
 
-from django.test import TestCase
+import os
+import random
+from decimal import Decimal
+from unittest.mock import patch
 
-from split_free_backend.core.algo_debts import calculate_new_debts
+from django.test import TestCase, override_settings
+
+from split_free_backend.core.algo_debts import (
+    calculate_new_debts,
+    get_settlement_cache,
+    get_settlement_executor,
+)
 from split_free_backend.core.models import Balance, Debt, Group, Member
+from split_free_backend.core.settlement import SettlementTimeout
 
 
 class OurAlgoTests(TestCase):
     def assert_all_debts_paid(self, balances):
         group = balances[0].group
         # Dictionary whose key is a member an whose value is the balance in a group
-        debt_checker = dict.fromkeys([balance.owner for balance in balances], 0.00)
+        debt_checker = dict.fromkeys([balance.owner for balance in balances], Decimal(0))
         for debt in Debt.objects.filter(group=group):
-            debt_checker[debt.borrower] += float(debt.amount)
-            debt_checker[debt.lender] -= float(debt.amount)
+            debt_checker[debt.borrower] += debt.amount
+            debt_checker[debt.lender] -= debt.amount
 
         for balance in balances:
             self.assertEqual(balance.amount, debt_checker[balance.owner])
 
     def setUp(self):
+        # Start from an empty settlements cache
+        get_settlement_cache.cache_clear()
         # Create a group
         self.group = Group.objects.create(title="Test Group", description="Group for testing")
 
@@ -114,3 +126,181 @@ class OurAlgoTests(TestCase):
             int((3 / 5) * number_of_members),
         )
         self.assert_all_debts_paid(balances)
+
+    def test_recomputing_unchanged_debts_writes_nothing(self):
+        # Setup
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(4)]
+        balances = [
+            Balance.objects.create(amount=amount, owner=member, group=self.group)
+            for amount, member in zip([-30, -10, 15, 25], members)
+        ]
+        calculate_new_debts(group=self.group)
+        debt_ids = set(Debt.objects.filter(group=self.group).values_list("id", flat=True))
+
+        # Action
+        # Only read the balances and the debts
+        with self.assertNumQueries(2):
+            calculate_new_debts(group=self.group)
+
+        # Checks
+        self.assertEqual(set(Debt.objects.filter(group=self.group).values_list("id", flat=True)), debt_ids)
+        self.assert_all_debts_paid(balances)
+
+    def test_changed_debts_are_updated_in_place(self):
+        # Setup
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(4)]
+        balances = [
+            Balance.objects.create(amount=amount, owner=member, group=self.group)
+            for amount, member in zip([-30, -10, 10, 30], members)
+        ]
+        calculate_new_debts(group=self.group)
+        debt_ids = set(Debt.objects.filter(group=self.group).values_list("id", flat=True))
+        for balance, amount in zip(balances, [-35, -5, 5, 35]):
+            balance.amount = amount
+            balance.save()
+
+        # Action
+        calculate_new_debts(group=self.group)
+
+        # Checks
+        self.assertEqual(set(Debt.objects.filter(group=self.group).values_list("id", flat=True)), debt_ids)
+        self.assert_all_debts_paid(balances)
+
+        # Debts between other members recycle the outdated rows
+        for balance, amount in zip(balances, [-30, -10, 15, 25]):
+            balance.amount = amount
+            balance.save()
+        calculate_new_debts(group=self.group)
+        self.assertTrue(debt_ids < set(Debt.objects.filter(group=self.group).values_list("id", flat=True)))
+        self.assertEqual(Debt.objects.filter(group=self.group).count(), 3)
+        self.assert_all_debts_paid(balances)
+
+    def test_groups_with_same_balances_share_their_settlement(self):
+        # Setup
+        other_group = Group.objects.create(title="Other Group")
+        for group in (self.group, other_group):
+            members = [Member.objects.create(name=f"Member {i}", group=group) for i in range(3)]
+            for amount, member in zip([-40, 20, 20], members):
+                Balance.objects.create(amount=amount, owner=member, group=group)
+
+        # Action
+        calculate_new_debts(group=self.group)
+        calculate_new_debts(group=other_group)
+
+        # Checks
+        self.assertEqual(get_settlement_cache().hits, 1)
+        self.assertEqual(get_settlement_cache().misses, 1)
+        self.assert_all_debts_paid(list(Balance.objects.filter(group=other_group)))
+
+    def test_each_currency_is_settled_on_its_own(self):
+        # Setup
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(5)]
+        for amount, currency, member in zip([-30, 10, 20, -5, 5], ["EUR", "EUR", "EUR", "USD", "USD"], members):
+            Balance.objects.create(amount=amount, currency=currency, owner=member, group=self.group)
+
+        # Action
+        calculate_new_debts(group=self.group)
+
+        # Checks
+        debts = Debt.objects.filter(group=self.group)
+        self.assertCountEqual(
+            [(debt.borrower, debt.lender, debt.amount, debt.currency) for debt in debts],
+            [
+                (members[1], members[0], 10, "EUR"),
+                (members[2], members[0], 20, "EUR"),
+                (members[4], members[3], 5, "USD"),
+            ],
+        )
+
+    @override_settings(DEBTS_SETTLEMENT_WORKERS=1)
+    def test_settled_here_once_the_workers_broke(self):
+        # Setup
+        # Enough balances in each currency to be settled on the workers
+        for currency in ("EUR", "USD"):
+            for i, amount in enumerate([-11] + [1] * 11):
+                member = Member.objects.create(name=f"{currency} {i}", group=self.group)
+                Balance.objects.create(amount=amount, currency=currency, owner=member, group=self.group)
+        get_settlement_executor.cache_clear()
+        self.addCleanup(get_settlement_executor.cache_clear)
+        executor = get_settlement_executor()
+        # A worker dies
+        executor.submit(os._exit, 1).exception()
+
+        # Action
+        calculate_new_debts(group=self.group)
+
+        # Checks
+        self.assertEqual(Debt.objects.filter(group=self.group).count(), 22)
+        new_executor = get_settlement_executor()
+        self.addCleanup(new_executor.shutdown)
+        self.assertIsNot(new_executor, executor)
+
+    @override_settings(DEBTS_SETTLEMENT_EXACT_MAX_MEMBERS=3)
+    def test_large_groups_are_settled_greedily(self):
+        # Setup
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(4)]
+        balances = [
+            Balance.objects.create(amount=amount, owner=member, group=self.group)
+            for amount, member in zip([-30, -10, 10, 30], members)
+        ]
+
+        # Action
+        calculate_new_debts(group=self.group)
+
+        # Checks
+        self.assertFalse(Group.objects.get(pk=self.group.pk).debts_optimal)
+        self.assert_all_debts_paid(balances)
+
+        # Unless the group asks for the fewest debts
+        self.group.settlement_strategy = "exact"
+        self.group.save()
+        calculate_new_debts(group=self.group)
+        self.assertTrue(Group.objects.get(pk=self.group.pk).debts_optimal)
+        self.assertEqual(Debt.objects.filter(group=self.group).count(), 2)
+        self.assert_all_debts_paid(balances)
+
+    def test_greedy_fallback_when_time_budget_is_spent(self):
+        # Setup
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(6)]
+        amounts = [-10, -7, -5, 1, 9, 12]
+        balances = [
+            Balance.objects.create(amount=amount, owner=member, group=self.group)
+            for amount, member in zip(amounts, members)
+        ]
+
+        # Action
+        with patch(
+            "split_free_backend.core.settlement.get_zero_sum_selections",
+            side_effect=SettlementTimeout,
+        ):
+            calculate_new_debts(group=self.group)
+
+        # Checks
+        self.assertFalse(Group.objects.get(pk=self.group.pk).debts_optimal)
+        self.assertLessEqual(Debt.objects.filter(group=self.group).count(), len(members) - 1)
+        self.assert_all_debts_paid(balances)
+
+        # The next simplification within the time budget is optimal again
+        calculate_new_debts(group=self.group)
+        self.assertTrue(Group.objects.get(pk=self.group.pk).debts_optimal)
+        self.assert_all_debts_paid(balances)
+
+    def test_large_group_without_zero_sum_subgroup_is_settled_greedily(self):
+        # Setup
+        number_of_members = 60
+        members = [Member.objects.create(name=f"Member {i}", group=self.group) for i in range(number_of_members)]
+        random_generator = random.Random(3)
+        amounts = [random_generator.randint(1, 10**5) for _ in range(number_of_members - 1)]
+        amounts.append(-sum(amounts))
+        balances = [
+            Balance.objects.create(amount=Decimal(amount) / 100, owner=member, group=self.group)
+            for amount, member in zip(amounts, members)
+        ]
+
+        # Action
+        calculate_new_debts(group=self.group, time_budget=0.05)
+
+        # Checks
+        self.assertFalse(Group.objects.get(pk=self.group.pk).debts_optimal)
+        self.assertEqual(Debt.objects.filter(group=self.group).count(), number_of_members - 1)
+        self.assert_all_debts_paid(balances)
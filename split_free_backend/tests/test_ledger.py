@@ -0,0 +1,77 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from decimal import Decimal
+
+from django.forms.models import model_to_dict
+from django.test import TestCase
+
+from split_free_backend.core.algo_debts import calculate_new_debts
+from split_free_backend.core.ledger import get_expense_shares, refresh_balances
+from split_free_backend.core.models import Balance, Expense, ExpenseShare, Group, Member
+from split_free_backend.core.signals import (
+    apply_impact_expense,
+    remove_debts_and_transfers,
+)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(title="Holidays")
+        self.members = [Member.objects.create(name=name, group=self.group) for name in ("Apo", "Michael", "Jeremy")]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+
+    def create_expense(self, amount, payer, participants):
+        expense = Expense.objects.create(amount=amount, title="Dinner", group=self.group, payer=payer)
+        expense.participants.set(participants)
+        apply_impact_expense(model_to_dict(expense))
+        calculate_new_debts(self.group)
+        return expense
+
+    def get_balances(self, members=None):
+        return [Balance.objects.get(owner=member).amount for member in members or self.members]
+
+    def test_expense_shares(self):
+        # Setup
+        expense = Expense.objects.create(
+            amount=Decimal("10.00"), title="Taxi", group=self.group, payer=self.members[2]
+        )
+        expense.participants.set(self.members[:2])
+
+        # Action
+        shares = get_expense_shares(model_to_dict(expense))
+
+        # Checks
+        self.assertEqual(
+            [(share.member_id, share.paid_cents, share.owed_cents) for share in shares],
+            [(self.members[0].id, 0, 500), (self.members[1].id, 0, 500), (self.members[2].id, 1000, 0)],
+        )
+
+    def test_refresh_balances_repairs_them(self):
+        # Setup
+        self.create_expense(Decimal("60.00"), self.members[0], self.members)
+        Balance.objects.filter(owner=self.members[1]).update(amount=123)
+
+        # Action
+        with self.assertNumQueries(3):
+            refresh_balances([self.group.id])
+
+        # Checks
+        self.assertEqual(self.get_balances(), [-40, 20, 20])
+
+    def test_member_removal_writes_off_their_debts(self):
+        # Setup
+        self.create_expense(Decimal("60.00"), self.members[0], self.members)
+        self.create_expense(Decimal("30.00"), self.members[1], self.members[1:])
+
+        # Action
+        # Jeremy owes 35 to Apo and leaves, Michael still owes 5 to Apo
+        remove_debts_and_transfers(sender=None, instance=self.members[2])
+        self.members[2].delete()
+
+        # Checks
+        self.assertEqual(self.get_balances(self.members[:2]), [-5, 5])
+        self.assertEqual(ExpenseShare.objects.filter(expense=None).count(), 1)
+        # The ledger still explains the balances
+        refresh_balances([self.group.id])
+        self.assertEqual(self.get_balances(self.members[:2]), [-5, 5])
@@ -0,0 +1,136 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from threading import Barrier, Thread
+from unittest import skipUnless
+
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from split_free_backend.core.locking import LockWaits, lock_groups, lock_waits
+from split_free_backend.core.models import Balance, Expense, Group, Member
+from split_free_backend.core.signals import handle_expense_created
+
+
+class LockGroupsTests(TestCase):
+    def setUp(self):
+        lock_waits.clear()
+        self.groups = [Group.objects.create(title=f"Group{i}") for i in range(3)]
+        for group in self.groups:
+            for name in ("Apo", "Michael"):
+                Balance.objects.create(owner=Member.objects.create(name=name, group=group), group=group)
+
+    def test_groups_locked_by_increasing_id(self):
+        # Action
+        with CaptureQueriesContext(connection) as queries:
+            lock_groups([self.groups[2].id, self.groups[0].id, self.groups[2].id])
+
+        # Checks
+        # The group and then its balances, for each group once
+        self.assertEqual(len(queries), 4)
+        self.assertIn("core_group", queries[0]["sql"])
+        self.assertIn("core_balance", queries[1]["sql"])
+        self.assertIn(f"= {self.groups[0].id}", queries[0]["sql"])
+        self.assertIn(f"= {self.groups[2].id}", queries[2]["sql"])
+        self.assertEqual(list(lock_waits.stats()), [self.groups[0].id, self.groups[2].id])
+        self.assertEqual(lock_waits.stats()[self.groups[0].id]["locks"], 1)
+
+    @override_settings(GROUP_WRITE_LOCK="advisory")
+    def test_advisory_lock_falls_back_to_row_lock(self):
+        # Action
+        with CaptureQueriesContext(connection) as queries:
+            lock_groups([self.groups[0].id])
+
+        # Checks
+        if connection.vendor == "postgresql":
+            self.assertIn("pg_advisory_xact_lock", queries[0]["sql"])
+        else:
+            self.assertIn("core_group", queries[0]["sql"])
+
+    @override_settings(GROUP_WRITE_LOCK=None)
+    def test_no_lock(self):
+        with self.assertNumQueries(0):
+            lock_groups([self.groups[0].id])
+        self.assertEqual(lock_waits.stats(), {})
+
+    def test_expense_created_locks_its_group(self):
+        # Setup
+        group = self.groups[1]
+        expense = Expense.objects.create(amount=10, title="Taxi", group=group, payer=group.members.first())
+        expense.participants.set(group.members.all())
+
+        # Action
+        handle_expense_created(sender=None, instance=expense)
+
+        # Checks
+        self.assertEqual(list(lock_waits.stats()), [group.id])
+
+    def test_lock_waits_of_the_latest_groups(self):
+        # Setup
+        waits = LockWaits(maxsize=2)
+
+        # Action
+        waits.record(1, 0.5)
+        waits.record(2, 0.25)
+        waits.record(1, 0.5)
+        waits.record(3, 0)
+
+        # Checks
+        self.assertEqual(waits.stats(), {1: {"locks": 2, "wait": 1.0}, 3: {"locks": 1, "wait": 0}})
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite has no row locks")
+class ConcurrentWritersTests(TransactionTestCase):
+    def setUp(self):
+        self.group = Group.objects.create(title="Group")
+        self.members = [Member.objects.create(name=name, group=self.group) for name in ("Apo", "Michael")]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group)
+
+    def create_expense(self):
+        Expense.objects.create(amount=10, title="Taxi", group=self.group, payer=self.members[0])
+
+    def rename_group(self):
+        Group.objects.filter(pk=self.group.pk).update(title="Friends")
+
+    def write_concurrently(self, writes, constraints):
+        # Each write runs in its own connection and transaction, and then
+        # locks the group once all of them are done, as the views do
+        barrier = Barrier(len(writes), timeout=10)
+        errors = []
+
+        def run(write):
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"SET CONSTRAINTS ALL {constraints}")
+                    write()
+                    barrier.wait()
+                    lock_groups([self.group.pk])
+            except Exception as error:
+                errors.append(error)
+                barrier.abort()
+            finally:
+                connections.close_all()
+
+        threads = [Thread(target=run, args=(write,)) for write in writes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_no_deadlock(self):
+        # The foreign keys are checked at the commit, or right away and then
+        # hold a key share lock on the group before it is locked
+        for constraints in ("DEFERRED", "IMMEDIATE"):
+            for writes in (
+                (self.create_expense, self.create_expense),
+                (self.rename_group, self.create_expense),
+            ):
+                with self.subTest(constraints=constraints, writes=[write.__name__ for write in writes]):
+                    # Action
+                    errors = self.write_concurrently(writes, constraints)
+
+                    # Checks
+                    self.assertEqual(errors, [])
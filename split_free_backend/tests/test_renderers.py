@@ -0,0 +1,127 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import io
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from split_free_backend.benchmarks.rendering import run_benchmark
+from split_free_backend.core.parsers import FastJSONParser, MessagePackParser
+from split_free_backend.core.renderers import (
+    FastJSONRenderer,
+    MessagePackRenderer,
+    msgpack,
+)
+
+DATA = {
+    "amount": Decimal("12.50"),
+    "amounts": ["-0.25", "10.00"],
+    "dates": [
+        datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc),
+        datetime(2024, 3, 1, 12, 30, 0, 123456, tzinfo=timezone(timedelta(hours=2))),
+        datetime(2024, 3, 1, 12, 30),
+        date(2024, 3, 1),
+    ],
+    "duration": timedelta(minutes=1),
+    "id": uuid.UUID(int=1),
+    "lazy": gettext_lazy("Group"),
+    "text": 'Dîner "ensemble"\n  \x01😀',
+    "numbers": [0, -1, 1.5, True, None],
+    1: "non string key",
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_same_content_as_the_rest_framework_renderer(self):
+        # Integers of more than 64 bits are left to the stdlib
+        for data in (DATA, [DATA], [], {}, "text", Decimal("1.10"), None, {"big": 2**70}):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_same_content_when_indented(self):
+        # Action
+        content = FastJSONRenderer().render(DATA, "application/json; indent=4")
+
+        # Checks
+        self.assertEqual(content, JSONRenderer().render(DATA, "application/json; indent=4"))
+        self.assertIn(b"\n    ", content)
+
+    def test_same_content_without_orjson(self):
+        with patch("split_free_backend.core.renderers.orjson", None):
+            self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_unserializable_data(self):
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({"value": object()})
+
+
+class FastJSONParserTests(SimpleTestCase):
+    def parse(self, parser, content, encoding="utf-8"):
+        return parser.parse(io.BytesIO(content), parser_context={"encoding": encoding})
+
+    def test_same_data_as_the_rest_framework_parser(self):
+        for content, encoding in (
+            (JSONRenderer().render(DATA), "utf-8"),
+            (b'{"big": 1180591620717411303424, "float": 1e-07}', "utf-8"),
+            (b'{"a": 1, "a": 2}', "utf-8"),
+            (b"[]", "utf-8"),
+            ('{"a": "é"}'.encode("latin-1"), "latin-1"),
+        ):
+            with self.subTest(content=content):
+                self.assertEqual(
+                    self.parse(FastJSONParser(), content, encoding), self.parse(JSONParser(), content, encoding)
+                )
+
+    def test_invalid_content(self):
+        for content in (b"", b"[1,", b'{"amount": NaN}', b"\xff"):
+            with self.subTest(content=content):
+                with self.assertRaises(ParseError):
+                    self.parse(FastJSONParser(), content)
+
+    def test_same_data_without_orjson(self):
+        with patch("split_free_backend.core.parsers.orjson", None):
+            self.assertEqual(self.parse(FastJSONParser(), b'{"amount": "1.00"}'), {"amount": "1.00"})
+
+    def test_benchmark(self):
+        # Action
+        results = run_benchmark(rows=[3])
+
+        # Checks
+        self.assertEqual([result["payload"] for result in results], ["balances", "expenses"])
+        self.assertTrue(all(result["identical"] for result in results))
+
+
+@skipUnless(msgpack, "msgpack is not installed")
+class MessagePackTests(SimpleTestCase):
+    def test_render_and_parse(self):
+        # Setup
+        data = {"id": 1, "amount": 1250, "title": "Dîner", "participants": [1, 2], "description": None}
+
+        # Action
+        content = MessagePackRenderer().render(data)
+
+        # Checks
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(content)), data)
+        self.assertLess(len(content), len(JSONRenderer().render(data)))
+
+    def test_render_like_json(self):
+        # Action
+        content = MessagePackRenderer().render({"date": DATA["dates"][0], "lazy": DATA["lazy"]})
+
+        # Checks
+        self.assertEqual(msgpack.unpackb(content), {"date": "2024-03-01T12:30:00Z", "lazy": "Group"})
+        self.assertEqual(MessagePackRenderer().render(None), b"")
+
+    def test_invalid_content(self):
+        for content in (b"\xc1", b"\x92\x01", msgpack.packb(1) + b"\x01"):
+            with self.subTest(content=content):
+                with self.assertRaises(ParseError):
+                    MessagePackParser().parse(io.BytesIO(content))
@@ -0,0 +1,315 @@
+# Copyright (c) 2024 SplitFree Org.
+
+import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import count
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from split_free_backend.benchmarks.settlement import run_benchmark
+from split_free_backend.core.money import allocate_cents, from_cents, to_cents
+from split_free_backend.core.settlement import (
+    SettlementCache,
+    Transfer,
+    get_greedy_transfers,
+    get_transfers_from,
+    get_vectorized_transfers,
+    numpy,
+    settle,
+    settle_partitions,
+)
+
+
+def legacy_get_selection_with_sum(target_sum, selection_length, balances):
+    # The combinatorial search calculate_new_debts used before the zero-sum
+    # partition solver, kept as a reference for the timing tests
+    if selection_length == len(balances) and target_sum == 0:
+        return balances
+    if selection_length == 1:
+        for balance in balances:
+            if balance.amount == target_sum:
+                return [balance]
+        return []
+    if selection_length == 2:
+        low_index = 0
+        high_index = len(balances) - 1
+        while low_index < high_index:
+            sum_balances = balances[low_index].amount + balances[high_index].amount
+            if sum_balances < target_sum:
+                low_index += 1
+            elif sum_balances > target_sum:
+                high_index -= 1
+            else:
+                return [balances[low_index], balances[high_index]]
+        return []
+    for first_index in range(len(balances) - (selection_length - 1)):
+        potential_matching_selection = legacy_get_selection_with_sum(
+            target_sum=target_sum - balances[first_index].amount,
+            balances=balances[first_index + 1 :],
+            selection_length=selection_length - 1,
+        )
+        if potential_matching_selection:
+            return [balances[first_index]] + potential_matching_selection
+    return []
+
+
+def legacy_number_of_debts(balances):
+    balances = sorted(balances, key=lambda balance: balance.amount)
+    number_of_debts = 0
+    selection_length = 1
+    while balances:
+        if selection_length > len(balances) // 2:
+            selection_length = len(balances)
+        selection = legacy_get_selection_with_sum(target_sum=0, selection_length=selection_length, balances=balances)
+        if not selection:
+            selection_length += 1
+        else:
+            balances = [balance for balance in balances if balance not in selection]
+            number_of_debts += max(len([balance for balance in selection if balance.amount]) - 1, 0)
+    return number_of_debts
+
+
+def number_of_debts(amounts):
+    return len(settle(list(enumerate(amounts))).transfers)
+
+
+def assert_settles(test, amounts, settlement):
+    # Every member ends up with a null balance
+    left = dict(enumerate(amounts))
+    for transfer in settlement.transfers:
+        left[transfer.borrower] -= transfer.cents
+        left[transfer.lender] += transfer.cents
+    test.assertFalse(any(left.values()))
+
+
+def make_balances(amounts):
+    return [SimpleNamespace(id=index, amount=Decimal(amount)) for index, amount in enumerate(amounts)]
+
+
+class ZeroSumPartitionTests(SimpleTestCase):
+    def test_never_more_debts_than_legacy_search(self):
+        random_generator = random.Random(42)
+        for _ in range(200):
+            amounts = [random_generator.randint(-20, 20) for _ in range(random_generator.randint(1, 9))]
+            amounts.append(-sum(amounts))
+
+            self.assertLessEqual(
+                number_of_debts(amounts),
+                legacy_number_of_debts(make_balances(amounts)),
+            )
+
+    def test_finds_the_minimum_where_greedy_selection_does_not(self):
+        # Taking the first zero-sum triplet (-10, -2, 12) leaves balances that
+        # cannot be split in two triplets anymore, whereas (-10, 1, 9),
+        # (-7, -2, 9) and (-7, -5, 12) settle the group with 6 debts
+        amounts = [-10, -7, -7, -5, -2, 1, 9, 9, 12]
+
+        self.assertEqual(number_of_debts(amounts), 6)
+        self.assertEqual(legacy_number_of_debts(make_balances(amounts)), 7)
+
+    def test_one_payer_for_a_large_group(self):
+        # One member paid a dinner for everyone: the only zero-sum selection is
+        # the whole group, which the legacy search reaches last
+        amounts = [-7 * 19] + [7] * 19
+
+        self.assertEqual(number_of_debts(amounts), legacy_number_of_debts(make_balances(amounts)))
+
+    def test_twenty_five_members_without_zero_sum_subgroup(self):
+        random_generator = random.Random(7)
+        amounts = [random_generator.randint(1, 10**6) * random_generator.choice([-1, 1]) for _ in range(24)]
+        amounts.append(-sum(amounts))
+
+        self.assertEqual(number_of_debts(amounts), 24)
+
+    def test_time_budget_is_a_hard_cap(self):
+        # Groups of 30 to 40 members owing small repeated amounts, whose exact
+        # search mostly takes longer than the budget. The clock moves by a
+        # millisecond each time the search looks at it, whatever the load.
+        random_generator = random.Random(1)
+        optimal = []
+        for _ in range(60):
+            largest = random_generator.randint(4, 14)
+            amounts = [
+                random_generator.randint(1, largest) * random_generator.choice([-7, 7, -11, 11, -13, 13])
+                for _ in range(random_generator.randint(29, 39))
+            ]
+            amounts.append(-sum(amounts))
+            clock = count(step=0.001)
+
+            with patch("split_free_backend.core.settlement.monotonic", side_effect=lambda: next(clock)):
+                settlement = settle(list(enumerate(amounts)), time_budget=0.05)
+
+            # The search stops the first time it sees the deadline passed, and
+            # the group is settled greedily
+            self.assertLess(next(clock), 0.0525)
+            assert_settles(self, amounts, settlement)
+            optimal.append(settlement.optimal)
+
+        self.assertIn(False, optimal)
+
+
+class SettleTests(SimpleTestCase):
+    def test_transfers_refer_to_member_ids(self):
+        settlement = settle([(7, -4000), (8, 2000), (9, 0), (10, 2000)])
+
+        self.assertTrue(settlement.optimal)
+        self.assertCountEqual(settlement.transfers, [Transfer(8, 7, 2000), Transfer(10, 7, 2000)])
+
+    def test_greedy_strategy(self):
+        settlement = settle([(1, -600), (2, -400), (3, 100), (4, 500), (5, 400)], strategy="greedy")
+
+        self.assertFalse(settlement.optimal)
+        self.assertEqual(settlement.transfers, [Transfer(4, 1, 500), Transfer(5, 2, 400), Transfer(3, 1, 100)])
+
+
+class SettlePartitionsTests(SimpleTestCase):
+    def make_partitions(self):
+        random_generator = random.Random(9)
+        partitions = {}
+        for currency, first_member_id in (("EUR", 0), ("USD", 100), ("TRY", 200)):
+            amounts = [random_generator.randint(-50, 50) * 100 for _ in range(13)]
+            amounts.append(-sum(amounts))
+            partitions[currency] = [(first_member_id + index, amount) for index, amount in enumerate(amounts)]
+        partitions["GBP"] = [(300, -100), (301, 100)]
+        return partitions
+
+    def test_partitions_are_settled_independently(self):
+        settlements = settle_partitions(self.make_partitions())
+
+        for currency, balances in self.make_partitions().items():
+            self.assertEqual(
+                settlements[currency].transfers,
+                settle(balances).transfers,
+            )
+
+    def test_partitions_are_settled_concurrently_on_workers(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            settlements = settle_partitions(self.make_partitions(), executor=executor)
+
+        for currency, balances in self.make_partitions().items():
+            self.assertTrue(settlements[currency].optimal)
+            self.assertEqual(settlements[currency].transfers, settle(balances).transfers)
+
+
+class SettlementCacheTests(SimpleTestCase):
+    def test_same_balances_reuse_the_settlement_of_other_members(self):
+        cache = SettlementCache()
+        settle([(1, -4000), (2, 2000), (3, 2000)], cache=cache)
+
+        settlement = settle([(6, 2000), (5, -4000), (4, 2000)], cache=cache)
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0, "size": 1})
+        self.assertTrue(settlement.optimal)
+        self.assertCountEqual(settlement.transfers, [Transfer(6, 5, 2000), Transfer(4, 5, 2000)])
+
+    def test_strategies_do_not_share_settlements(self):
+        cache = SettlementCache()
+        settle([(1, -100), (2, 100)], cache=cache)
+
+        settlement = settle([(1, -100), (2, 100)], strategy="greedy", cache=cache)
+
+        self.assertFalse(settlement.optimal)
+        self.assertEqual(cache.misses, 2)
+
+    def test_least_recently_used_settlements_are_evicted(self):
+        cache = SettlementCache(maxsize=2)
+        for amount in (100, 200, 100, 300):
+            settle([(1, -amount), (2, amount)], cache=cache)
+
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(len(cache.templates), 2)
+        settle([(1, -100), (2, 100)], cache=cache)
+        self.assertEqual(cache.hits, 2)
+
+    def test_settlements_cut_short_are_not_kept(self):
+        cache = SettlementCache()
+        random_generator = random.Random(1)
+        amounts = [random_generator.randint(1, 10**6) for _ in range(59)]
+        amounts.append(-sum(amounts))
+
+        settlement = settle(list(enumerate(amounts)), time_budget=1, cache=cache)
+
+        self.assertFalse(settlement.optimal)
+        self.assertEqual(len(cache.templates), 0)
+
+    def test_shared_backend(self):
+        backend = {}
+        backend_cache = SimpleNamespace(get=backend.get, set=backend.__setitem__)
+        settle([(1, -100), (2, 100)], cache=SettlementCache(backend=backend_cache))
+
+        cache = SettlementCache(backend=backend_cache)
+        settlement = settle([(3, -100), (4, 100)], cache=cache)
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(settlement.transfers, [Transfer(4, 3, 100)])
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_every_strategy_settles_every_benchmark_group(self):
+        results = run_benchmark(sizes=(3, 10, 25), repeat=1)
+
+        for result in results:
+            self.assertTrue(result["settled"], result)
+            self.assertLess(result["transfers"], result["size"], result)
+
+
+class GreedyTransfersTests(SimpleTestCase):
+    def test_largest_borrower_pays_largest_lender_first(self):
+        cents = array("q", [-500, -100, 300, 200, 100])
+
+        transfers = get_greedy_transfers(cents, range(len(cents)))
+
+        self.assertEqual(transfers, [(2, 0, 300), (3, 0, 200), (4, 1, 100)])
+
+
+@skipUnless(numpy, "NumPy is not installed")
+class VectorizedTransfersTests(SimpleTestCase):
+    def test_cumulative_matching_of_sorted_borrowers_and_lenders(self):
+        cents = array("q", [-500, 300, -100, 0, 200, 100])
+
+        transfers = get_vectorized_transfers(cents)
+
+        self.assertEqual(transfers, [(1, 0, 300), (4, 0, 200), (5, 2, 100)])
+
+    def test_at_most_one_transfer_less_than_members(self):
+        random_generator = random.Random(11)
+        for size in (2, 3, 10, 100, 1000):
+            amounts = [random_generator.randint(-10000, 10000) for _ in range(size - 1)]
+            amounts.append(-sum(amounts))
+
+            settlement = settle(list(enumerate(amounts)), strategy="vectorized")
+
+            self.assertLessEqual(len(settlement.transfers), size - 1)
+            assert_settles(self, amounts, settlement)
+
+
+class CentsTests(SimpleTestCase):
+    def test_round_trip_between_decimal_and_cents(self):
+        self.assertEqual(to_cents(Decimal("-12.34")), -1234)
+        self.assertEqual(to_cents(Decimal("0.005")), 1)
+        self.assertEqual(to_cents(20.1), 2010)
+        self.assertEqual(from_cents(-1234), Decimal("-12.34"))
+        self.assertEqual(str(from_cents(0)), "0.00")
+
+    def test_thirds_settle_without_rounding_residue(self):
+        # 0.1 + 0.2 != 0.3 in floats, the cents of a selection sum up exactly
+        cents = array("q", [to_cents(amount) for amount in ("0.10", "0.20", "-0.30")])
+
+        transfers = get_transfers_from(sorted(range(3), key=cents.__getitem__), cents)
+
+        self.assertEqual(sorted(transfers), [(0, 2, 10), (1, 2, 20)])
+
+    def test_allocate_cents_sums_up_exactly(self):
+        self.assertEqual(allocate_cents(1000, [1, 1, 1]), [334, 333, 333])
+        self.assertEqual(allocate_cents(1001, [1, 1, 1]), [334, 334, 333])
+        self.assertEqual(allocate_cents(-1000, [1, 1, 1]), [-333, -333, -334])
+        # The cents left go to the largest remainders
+        self.assertEqual(allocate_cents(100, [1, 2, 4]), [14, 29, 57])
+        for cents in range(-50, 50):
+            for weights in ([1], [1, 1, 1, 1, 1, 1, 1], [3, 1, 2]):
+                self.assertEqual(sum(allocate_cents(cents, weights)), cents)
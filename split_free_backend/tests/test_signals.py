@@ -1,11 +1,33 @@
 # Copyright (c) 2023 SplitFree Org.
 
+from decimal import Decimal
+
+from django.db import connection
 from django.db.models.signals import post_save
+from django.forms.models import model_to_dict
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from split_free_backend.core.models import Balance, Debt, Expense, Group, Member, User
-from split_free_backend.core.signals import handle_group_created
+from split_free_backend.core.models import (
+    Balance,
+    Debt,
+    Expense,
+    ExpenseShare,
+    Group,
+    Member,
+    User,
+)
+from split_free_backend.core.money import from_cents
+from split_free_backend.core.signals import (
+    apply_impact_expense,
+    handle_expense_created,
+    handle_group_created,
+    remove_members,
+    renew_impact_expense,
+    undo_impact_expense,
+)
+from split_free_backend.core.unit_of_work import unit_of_work
 
 
 class BaseAPITestCase(TestCase):
@@ -227,6 +249,33 @@ class GroupSignalTests(BaseAPITestCase):
             -5.00,
         )
 
+    def test_remove_members_with_constant_queries(self):
+        # Setup
+        group = Group.objects.create(title="Holidays", description="Great holidays")
+        members = [Member.objects.create(name=f"Member{i}", group=group) for i in range(5)]
+        for member in members:
+            Balance.objects.create(owner=member, group=group, amount=0.00)
+
+        def remove_members_queries(number_of_expenses, removed_members):
+            remaining_members = list(Member.objects.filter(group=group))
+            for i in range(number_of_expenses):
+                expense = Expense.objects.create(
+                    amount=10, title="Coffee", group=group, payer=remaining_members[i % len(remaining_members)]
+                )
+                expense.participants.set(remaining_members)
+                apply_impact_expense(model_to_dict(expense))
+            # The debts are recomputed at the end of the unit of work
+            with unit_of_work(), CaptureQueriesContext(connection) as queries:
+                remove_members(group, Member.objects.filter(pk__in=[member.pk for member in removed_members]))
+            return len(queries)
+
+        # Action & Checks
+        self.assertEqual(remove_members_queries(5, members[3:4]), remove_members_queries(50, members[4:]))
+        # The expenses paid by the removed members are free for the others
+        self.assertEqual(sum(Balance.objects.filter(group=group).values_list("amount", flat=True)), 0)
+        self.assertFalse(Expense.objects.filter(group=group, payer__in=members[3:]).exists())
+        self.assertFalse(ExpenseShare.objects.filter(member__in=members[3:]).exists())
+
 
 class ExpenseSignalTests(BaseAPITestCase):
     @override_settings(USE_TZ=False)  # Override settings to avoid issues with signals
@@ -414,6 +463,112 @@ class ExpenseSignalTests(BaseAPITestCase):
         debt_member3.amount = 20.00
         debt_member3.save()
 
+    def test_handle_expense_created_signal_uneven_split(self):
+        # Setup
+        group = Group.objects.create(title="Holidays", description="Great holidays")
+        group.users.add(self.user)
+        members = [Member.objects.create(name=name, group=group) for name in ("Apo", "Michael", "Jeremy")]
+        for member in members:
+            Balance.objects.create(owner=member, group=group, amount=0.00)
+
+        # Action
+        # 10.00 can't be split evenly in three
+        expense_data = {
+            "amount": "10.00",
+            "title": "Coffee",
+            "payer": members[1].id,
+            "group": group.id,
+            "participants": [member.id for member in members],
+        }
+        response = self.client.post(
+            "/api/expenses/",
+            expense_data,
+            format="json",
+            headers=self.get_auth_headers(),
+        )
+
+        # Checks
+        # The extra cent goes to the first member, the balances sum up to 0
+        balances = [Balance.objects.get(owner=member).amount for member in members]
+        self.assertEqual(balances, [Decimal("3.34"), Decimal("-6.67"), Decimal("3.33")])
+        self.assertEqual(sum(balances), 0)
+
+        # Deleting the expense takes back exactly the same shares
+        self.client.delete(
+            f"/api/expenses/{response.data['id']}/",
+            format="json",
+            headers=self.get_auth_headers(),
+        )
+        for member in members:
+            self.assertEqual(Balance.objects.get(owner=member).amount, 0)
+
+    def test_expenses_in_two_currencies(self):
+        # Setup
+        group = Group.objects.create(title="Holidays", description="Great holidays")
+        members = [Member.objects.create(name=name, group=group) for name in ("Apo", "Michael")]
+        for member in members:
+            Balance.objects.create(owner=member, group=group, amount=0.00)
+        expenses = []
+        for amount, currency, payer in ((Decimal("100.00"), "USD", members[0]), (Decimal("60.00"), "EUR", members[1])):
+            expense = Expense.objects.create(
+                amount=amount, title="Dinner", currency=currency, group=group, payer=payer
+            )
+            expense.participants.set(members)
+            expenses.append(expense)
+
+        # Action
+        with unit_of_work():
+            for expense in expenses:
+                handle_expense_created(sender=None, instance=expense)
+
+        # Checks
+        # Each member owes the other in the currency the other paid in
+        self.assertCountEqual(
+            Balance.objects.filter(group=group).values_list("owner", "currency", "amount"),
+            [
+                (members[0].id, "USD", Decimal("-50.00")),
+                (members[1].id, "USD", Decimal("50.00")),
+                (members[0].id, "EUR", Decimal("30.00")),
+                (members[1].id, "EUR", Decimal("-30.00")),
+            ],
+        )
+        self.assertCountEqual(
+            Debt.objects.filter(group=group).values_list("borrower", "lender", "amount", "currency"),
+            [
+                (members[1].id, members[0].id, Decimal("50.00"), "USD"),
+                (members[0].id, members[1].id, Decimal("30.00"), "EUR"),
+            ],
+        )
+
+    def test_expense_impact_with_constant_queries(self):
+        # Setup
+        group = Group.objects.create(title="Holidays", description="Great holidays")
+        members = [Member.objects.create(name=f"Member{i}", group=group) for i in range(15)]
+        for member in members:
+            Balance.objects.create(owner=member, group=group, amount=0.00)
+        expense = Expense.objects.create(amount=Decimal("100.00"), title="Hotel", group=group, payer=members[0])
+
+        for participants in (members[:3], members):
+            expense.participants.set(participants)
+            expense_info = model_to_dict(expense)
+            new_expense_info = dict(expense_info, amount=Decimal("150.00"), payer=members[1].id)
+
+            # Action & Checks
+            # Writing the ledger rows and refreshing the balances from them
+            # takes the same queries whatever the number of participants
+            with self.assertNumQueries(4):
+                apply_impact_expense(expense_info)
+            with self.assertNumQueries(5):
+                renew_impact_expense(expense_info, new_expense_info)
+            self.assertEqual(sum(Balance.objects.filter(group=group).values_list("amount", flat=True)), 0)
+            self.assertEqual(
+                Balance.objects.get(owner=members[1]).amount, from_cents(15000 // len(participants) - 15000)
+            )
+            # No ledger rows are left to write to the balances
+            with self.assertNumQueries(3):
+                undo_impact_expense(new_expense_info)
+            self.assertEqual(set(Balance.objects.filter(group=group).values_list("amount", flat=True)), {0})
+
     def test_handle_expense_updated_signal_added_members(self):
         # Setup
         self.create_basic_expense()
@@ -525,6 +680,25 @@ class ExpenseSignalTests(BaseAPITestCase):
 
         self.assertEqual(Debt.objects.filter(group=self.group).count(), 2)
 
+    def test_handle_expense_updated_signal_new_currency(self):
+        # Setup
+        self.create_basic_expense()
+
+        # Action
+        self.client.patch(
+            f"/api/expenses/{self.expense.id}/",
+            {"currency": "USD"},
+            content_type="application/json",
+            headers=self.get_auth_headers(),
+        )
+
+        # Checks
+        # The balances and debts move to the new currency
+        for member, amount in zip(self.members, [-40.00, 20.00, 20.00]):
+            self.assertEqual(Balance.objects.get(owner=member, currency="USD").amount, amount)
+            self.assertEqual(Balance.objects.get(owner=member, currency="EUR").amount, 0)
+        self.assertEqual(set(Debt.objects.filter(group=self.group).values_list("currency", flat=True)), {"USD"})
+
     def test_handle_expense_updated_signal_changed_payer(self):
         # Setup
         self.create_basic_expense()
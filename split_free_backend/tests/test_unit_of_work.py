@@ -0,0 +1,185 @@
+# Copyright (c) 2024 SplitFree Org.
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from split_free_backend.core import unit_of_work as uow
+from split_free_backend.core.algo_debts import calculate_new_debts
+from split_free_backend.core.helpers import get_auth_headers
+from split_free_backend.core.ledger import refresh_balances
+from split_free_backend.core.models import Balance, Debt, Expense, Group, Member, User
+from split_free_backend.core.signals import (
+    handle_expense_created,
+    handle_group_created,
+    remove_debts_and_transfers,
+)
+from split_free_backend.core.unit_of_work import (
+    bump_versions,
+    defer_debts_recompute,
+    get_unit_of_work,
+    unit_of_work,
+)
+
+
+class UnitOfWorkTests(TestCase):
+    def setUp(self):
+        # The group signal tests leave it connected
+        post_save.disconnect(handle_group_created, sender=Group)
+        self.group = Group.objects.create(title="Holidays")
+        self.members = [Member.objects.create(name=name, group=self.group) for name in ("Apo", "Michael", "Jeremy")]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+
+    def create_expense(self, amount, payer):
+        expense = Expense.objects.create(amount=amount, title="Dinner", group=self.group, payer=payer)
+        expense.participants.set(self.members)
+        handle_expense_created(sender=None, instance=expense)
+        return expense
+
+    def test_flush_once_per_group(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts", wraps=calculate_new_debts) as calculate_mock:
+            with patch.object(uow, "refresh_balances", wraps=refresh_balances) as refresh_mock:
+                with unit_of_work():
+                    self.create_expense(Decimal("30.00"), self.members[0])
+                    self.create_expense(Decimal("60.00"), self.members[1])
+                    # Nothing is done until the end of the unit of work
+                    self.assertFalse(Debt.objects.exists())
+
+        # Checks
+        self.assertEqual(calculate_mock.call_count, 1)
+        self.assertEqual(refresh_mock.call_count, 1)
+        balances = [Balance.objects.get(owner=member).amount for member in self.members]
+        self.assertEqual(balances, [-0, -30, 30])
+        self.assertEqual(Debt.objects.count(), 1)
+        self.assertIsNone(get_unit_of_work())
+
+    def test_nested_units_of_work_flush_once(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts") as calculate_mock:
+            with unit_of_work() as outer_work:
+                with unit_of_work() as inner_work:
+                    self.create_expense(Decimal("30.00"), self.members[0])
+                self.assertEqual(calculate_mock.call_count, 0)
+
+        # Checks
+        self.assertIs(outer_work, inner_work)
+        self.assertEqual(calculate_mock.call_count, 1)
+
+    def test_nothing_flushed_on_error(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts") as calculate_mock:
+            with self.assertRaises(ValueError):
+                with unit_of_work():
+                    self.create_expense(Decimal("30.00"), self.members[0])
+                    raise ValueError
+
+        # Checks
+        calculate_mock.assert_not_called()
+        self.assertIsNone(get_unit_of_work())
+
+    @override_settings(USE_ON_COMMIT_HOOK=True)
+    def test_flush_on_commit(self):
+        # Action
+        with self.captureOnCommitCallbacks() as callbacks:
+            with unit_of_work():
+                self.create_expense(Decimal("30.00"), self.members[0])
+        self.assertFalse(Debt.objects.exists())
+        for callback in callbacks:
+            callback()
+
+        # Checks
+        self.assertEqual(Debt.objects.count(), 2)
+
+    def test_pending_work_flushed_before_member_removal(self):
+        # Setup
+        with unit_of_work():
+            self.create_expense(Decimal("30.00"), self.members[0])
+
+            # Action
+            remove_debts_and_transfers(sender=None, instance=self.members[2])
+            self.members[2].delete()
+
+        # Checks
+        # Jeremy's debt to Apo was written off
+        self.assertEqual(
+            [Balance.objects.get(owner=member).amount for member in self.members[:2]], [Decimal(-10), Decimal(10)]
+        )
+
+    def get_versions(self):
+        return Group.objects.values_list("version", "debts_version").get(pk=self.group.pk)
+
+    def test_bump_versions_once(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts"):
+            with unit_of_work():
+                bump_versions([self.group.pk])
+                bump_versions([self.group.pk])
+                # The debts are out of date after the new balances
+                defer_debts_recompute([self.group.pk])
+                versions = self.get_versions()
+                bump_versions([self.group.pk])
+
+        # Checks
+        self.assertEqual(versions, (2, 1))
+        self.assertEqual(self.get_versions(), (2, 1))
+
+    def test_bump_versions_keeps_the_debts_up_to_date(self):
+        # Action
+        bump_versions([self.group.pk])
+
+        # Checks
+        self.assertEqual(self.get_versions(), (1, 1))
+
+
+class UnitOfWorkViewTests(TestCase):
+    def setUp(self):
+        post_save.disconnect(handle_group_created, sender=Group)
+        self.user = User.objects.create(email="testuser@splitmail.com", password="testpassword", is_active=True)
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.group = Group.objects.create(title="Day of eating")
+        self.group.users.add(self.user)
+        self.members = [Member.objects.create(name=name, group=self.group) for name in ("A", "B", "C", "D")]
+        for member in self.members:
+            Balance.objects.create(owner=member, group=self.group, amount=0.00)
+        for i, amount in enumerate((10, 20, 40)):
+            expense = Expense.objects.create(amount=amount, title=f"Meal{i}", group=self.group, payer=self.members[i])
+            expense.participants.set(self.members)
+            handle_expense_created(sender=None, instance=expense)
+
+    def test_member_removal_recomputes_once(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts", wraps=calculate_new_debts) as calculate_mock:
+            with patch.object(uow, "refresh_balances", wraps=refresh_balances) as refresh_mock:
+                self.client.put(
+                    f"/api/groups/{self.group.id}/",
+                    {"title": "Day of eating", "member_names": ["A", "B"]},
+                    content_type="application/json",
+                    headers=get_auth_headers(self.access_token),
+                )
+
+        # Checks
+        # Three expenses were impacted
+        self.assertEqual(calculate_mock.call_count, 1)
+        self.assertEqual(refresh_mock.call_count, 1)
+        self.assertEqual(
+            [Balance.objects.get(owner=member).amount for member in self.members[:2]], [Decimal(5), Decimal(-5)]
+        )
+
+    def test_failed_request_discards_the_work(self):
+        # Action
+        with patch.object(uow, "calculate_new_debts") as calculate_mock:
+            response = self.client.post(
+                "/api/expenses/",
+                {"title": "Invalid", "group": self.group.id},
+                content_type="application/json",
+                headers=get_auth_headers(self.access_token),
+            )
+
+        # Checks
+        self.assertEqual(response.status_code, 400)
+        calculate_mock.assert_not_called()